@@ -1,12 +1,30 @@
 # Copyright 2010 Curtis McEnroe <programble@gmail.com>
 # Licensed under the GNU GPLv3
 
+import threading
+
 from scope import Scope
+import hamt
+
+def make_meta(position):
+    # Metadata of a node or lambda read from position, a (file, line) pair
+    if position is None:
+        return {"name": None}
+    return {"name": None, "file": position[0], "line": position[1]}
+
+class Base(object):
+    # Nodes have slots rather than a dict each, as there can be millions
+    # of them. Where a node was read from is kept in `position`, a (file,
+    # line) pair shared by the nodes read from the same line.
+    __slots__ = ("data", "position")
 
-class Base:
     def __init__(self, data):
         self.data = data
-        self.meta = {"name": None}
+
+    @property
+    def meta(self):
+        # Made when asked for
+        return make_meta(getattr(self, "position", None))
 
     def __eq__(self, other):
         # Must be of same type to compare
@@ -15,13 +33,23 @@ class Base:
         else:
             return False
 
+    def __hash__(self):
+        # Structural, like equality, so that values can be keys of maps
+        return hash(self.data)
+
     def __str__(self):
         return str(self.data)
 
     def evaluate(self, scope):
         raise NotImplementedError("Abstract Function")
 
+    def evaluate_tail(self, scope):
+        # Evaluate in tail position, where a TailCall may be returned
+        return self.evaluate(scope)
+
 class Atom(Base):
+    __slots__ = ()
+
     def __repr__(self):
         return repr(self.data)
 
@@ -29,13 +57,49 @@ class Atom(Base):
         return self
 
 class Number(Atom):
-    pass
+    __slots__ = ()
 
 class Character(Atom):
+    __slots__ = ()
+
     def __repr__(self):
         return '\\' + self.data
 
+def interned(cls, data):
+    # The one symbol or keyword of cls named data
+    atom = cls.table.get(data)
+    if atom is None:
+        atom = object.__new__(cls)
+        # Names are interned strings too, so looking them up in a scope
+        # compares them by identity, and their hash is only worked out once
+        if data.__class__ == str:
+            data = intern(data)
+        atom.data = data
+        # Another thread may have made it since
+        atom = cls.table.setdefault(data, atom)
+    return atom
+
 class Symbol(Base):
+    # Symbols are interned: there is only one symbol of each name, made the
+    # first time it is asked for, so symbols are equal only if they are the
+    # same object. They are shared by every form they are read in, so they
+    # have no position.
+    __slots__ = ()
+    table = {}
+
+    def __new__(cls, data):
+        return interned(cls, data)
+
+    def __init__(self, data):
+        pass
+
+    def __eq__(self, other):
+        return self is other
+
+    def __reduce__(self):
+        # Unpickled symbols are interned as well
+        return (Symbol, (self.data,))
+
     def __repr__(self):
         if ' ' in self.data or ')' in self.data:
             return '|' + self.data + '|'
@@ -47,57 +111,292 @@ class Symbol(Base):
         return scope[self.data]
 
 class Keyword(Atom):
+    # Keywords are interned like symbols
+    __slots__ = ()
+    table = {}
+
+    def __new__(cls, data):
+        return interned(cls, data)
+
+    def __init__(self, data):
+        pass
+
+    def __eq__(self, other):
+        return self is other
+
+    def __reduce__(self):
+        return (Keyword, (self.data,))
+
     def __repr__(self):
         return ':' + self.data
     
 class List(Base):
-    def car(self):
-        if len(self.data) and self.data != [[]]:
-            return self.data[0]
+    # A list is a chain of cons cells. Each cell holds its car in `head`
+    # and its cdr in `tail`; the empty list is a cell with neither. Tails
+    # are shared between lists, so car, cdr and cons are all O(1).
+    #
+    # A list that is a macro call site can also have its cached expansion
+    # in `expansion`, and a lambda list its analysis in `plan` (see
+    # Bindings). Both are left unset otherwise.
+    __slots__ = ("head", "tail", "expansion", "plan")
+
+    def __init__(self, data=[]):
+        # Build from a Python list of items terminated by [] (proper list)
+        # or by the final cdr (improper list)
+        if not len(data) or data == [[]]:
+            self.head = self.tail = None
+            return
+        if len(data) == 1 or data[-1].__class__ == list:
+            items, tail = data[:-1] or data, List()
         else:
-            return List([])
+            items, tail = data[:-1], data[-1]
+        for x in reversed(items[1:]):
+            tail = List.cons(x, tail)
+        self.head = items[0]
+        self.tail = tail
+
+    @staticmethod
+    def cons(car, cdr):
+        cell = List.__new__(List)
+        cell.head = car
+        cell.tail = cdr
+        return cell
+
+    def car(self):
+        if self.tail is None:
+            return List()
+        return self.head
 
     def cdr(self):
-        # Empty list
-        if not len(self.data) or self.data == [[]]:
-            return List([])
-        # Proper list
-        elif self.data[-1] == [] and len(self.data) > 2:
-            return List(self.data[1:])
-        elif self.data[1] == []:
-            return List([])
-        # Improper list
-        else:
-            return self.data[1]
-    
+        if self.tail is None:
+            return List()
+        return self.tail
+
+    def __iter__(self):
+        # Items of the proper part of the list
+        cell = self
+        while cell.__class__ == List and cell.tail is not None:
+            yield cell.head
+            cell = cell.tail
+        # A list consed onto a lazy sequence goes on with its items
+        if cell.__class__ == LazySeq:
+            for x in cell:
+                yield x
+
+    def __eq__(self, other):
+        a, b = self, other
+        while a.__class__ == List and b.__class__ == List:
+            if a.tail is None or b.tail is None:
+                return a.tail is b.tail
+            if not a.head == b.head:
+                return False
+            a, b = a.tail, b.tail
+        if b.__class__ == LazySeq:
+            return b == a
+        if a.__class__ == LazySeq:
+            return a == b
+        if a.__class__ == List or b.__class__ == List:
+            return False
+        return a == b
+
+    def __hash__(self):
+        return hash_items(self)
+
     def __repr__(self):
         # Empty list
-        if self.data == []:
+        if self.tail is None:
             return "nil"
-        # Proper list
-        elif self.data[-1] == []:
-            return '(' + ' '.join([repr(x) for x in self.data[:-1]]) + ')'
+        items = []
+        cell = self
+        while cell.__class__ == List and cell.tail is not None:
+            items.append(repr(cell.head))
+            cell = cell.tail
+        # Proper list, or a list consed onto a lazy sequence
+        if cell.__class__ == LazySeq:
+            items.extend(repr(x) for x in cell)
+            return '(' + ' '.join(items) + ')'
+        if cell.__class__ == List:
+            return '(' + ' '.join(items) + ')'
         # Improper list
         else:
-            return '(' + repr(self.car()) + " . " + repr(self.cdr()) + ')'
+            return '(' + ' '.join(items) + " . " + repr(cell) + ')'
 
     def __str__(self):
         return repr(self)
 
     def evaluate(self, scope):
         # Empty list
-        if not len(self.data) or self.data == [[]]:
+        if self.tail is None:
             return self
         # Improper list
-        elif self.data[-1] != []:
+        elif self.tail.__class__ != List:
             # Call the car with cdr as argument
-            return self.car().evaluate(scope)(scope, self.cdr())
+            return trampoline(self.head.evaluate(scope)(scope, self.tail))
         # Proper list
         else:
+            f = self.head.evaluate(scope)
+            # Macro calls reuse the expansion cached on this form
+            if f.__class__ == Macro:
+                return f.expand_form(scope, self).evaluate(scope)
             # Call the car with cdr as arguments
-            return self.car().evaluate(scope)(scope, *self.cdr().data[:-1])
+            return trampoline(f(scope, *self.tail))
+
+    def evaluate_tail(self, scope):
+        # Only proper, non-empty lists are calls that can be deferred
+        if self.tail is None or self.tail.__class__ != List:
+            return self.evaluate(scope)
+        f = self.head.evaluate(scope)
+        if f.__class__ == Macro:
+            return f.expand_form(scope, self).evaluate_tail(scope)
+        # Leave calls to lambdas for the trampoline of the calling form
+        if f.__class__ == Lambda:
+            return TailCall(f, scope, self.tail)
+        return f(scope, *self.tail)
+
+def same_items(a, b):
+    # Whether two proper lists or lazy sequences have equal items
+    a, b = iter(a), iter(b)
+    for x in a:
+        for y in b:
+            if not x == y:
+                return False
+            break
+        else:
+            return False
+    for y in b:
+        return False
+    return True
+
+def hash_items(xs):
+    # Of a list or lazy sequence, the same for equal ones
+    h = 0x345678
+    cell = xs
+    while cell.__class__ == List and cell.tail is not None:
+        h = ((h ^ hash(cell.head)) * 1000003) & 0xffffffff
+        cell = cell.tail
+    if cell.__class__ == LazySeq:
+        for x in cell:
+            h = ((h ^ hash(x)) * 1000003) & 0xffffffff
+    # Improper list
+    elif cell.__class__ != List:
+        h ^= hash(cell)
+    return h
+
+# The tail of a lazy sequence whose first item has not been made yet
+pending = object()
+
+class LazySeq(Base):
+    # A lazy sequence: a list whose items are made when they are needed.
+    # `data` is a function returning a Python iterator over the items,
+    # called when the first item is needed.
+    #
+    # The items are made one at a time from that iterator, kept in
+    # `iterator` until they are all made, and each is kept once made.
+    # Each LazySeq is then a cell, with an item in `head` and the LazySeq
+    # for the rest of the items in `tail`, like a List, and `tail` is None
+    # when there are no items left. Going through a lazy sequence again
+    # gives the same items without making them again. Cells no longer
+    # referred to are freed, so walking a lazy sequence whose head is not
+    # kept takes constant memory. The cells of a sequence share `lock`,
+    # so that two threads never make the same item.
+    __slots__ = ("iterator", "head", "tail", "lock")
+
+    def __init__(self, make):
+        self.data = make
+        self.iterator = None
+        self.tail = pending
+        self.lock = threading.Lock()
+
+    def realize(self):
+        # Make the first item, if that has not been done
+        if self.tail is pending:
+            with self.lock:
+                if self.tail is pending:
+                    self.make()
+        return self
+
+    def make(self):
+        iterator = self.iterator
+        if iterator is None:
+            # What the function refers to, such as the head of the
+            # sequence it goes through, is no longer needed
+            iterator = self.iterator = iter(self.data())
+            self.data = None
+        try:
+            self.head = next(iterator)
+        except StopIteration:
+            self.iterator = None
+            self.tail = None
+            return
+        rest = LazySeq.__new__(LazySeq)
+        rest.data = None
+        rest.iterator = iterator
+        rest.tail = pending
+        rest.lock = self.lock
+        self.iterator = None
+        self.tail = rest
+
+    def empty(self):
+        return self.realize().tail is None
+
+    def car(self):
+        if self.realize().tail is None:
+            return List()
+        return self.head
+
+    def cdr(self):
+        if self.realize().tail is None:
+            return List()
+        return self.tail
+
+    def __iter__(self):
+        return lazy_items(self)
+
+    def __eq__(self, other):
+        if other.__class__ != List and other.__class__ != LazySeq:
+            return False
+        # Comparing with nil only needs the first item
+        if other.__class__ == List and other.tail is None:
+            return self.empty()
+        return same_items(self, other)
+
+    def __hash__(self):
+        return hash_items(self)
+
+    def __repr__(self):
+        if self.empty():
+            return "nil"
+        return '(' + ' '.join(repr(x) for x in self) + ')'
+
+    def __str__(self):
+        return repr(self)
+
+    def __reduce__(self):
+        # Pickled as the list of its items
+        return (List, (list(self) + [[]],))
+
+    def evaluate(self, scope):
+        return self
+
+def lazy_items(cell):
+    # The items of a lazy sequence, made as they are needed. Only the
+    # cell of the next item is kept.
+    while True:
+        if cell.tail is pending:
+            with cell.lock:
+                if cell.tail is pending:
+                    cell.make()
+        if cell.tail is None:
+            return
+        yield cell.head
+        cell = cell.tail
 
 class String(List):
+    __slots__ = ()
+
+    def __init__(self, data):
+        Base.__init__(self, data)
+
     def car(self):
         if len(self.data):
             return Character(self.data[0])
@@ -110,6 +409,16 @@ class String(List):
         else:
             return String(self.data[1:])
 
+    def __iter__(self):
+        for c in self.data:
+            yield Character(c)
+
+    def __eq__(self, other):
+        return Base.__eq__(self, other)
+
+    def __hash__(self):
+        return hash(self.data)
+
     def __repr__(self):
         return '"' + repr(self.data)[1:-1] + '"'
 
@@ -120,120 +429,537 @@ class String(List):
         # A string evaluates to itself, as if a quoted list
         return self
 
+# What maps find for keys that are not in them
+missing = object()
+
+class Map(Base):
+    # A persistent hash map: a hash array mapped trie of its entries (see
+    # hamt.py) in `data`, and the number of entries in `count`. Maps are
+    # never changed, assoc and dissoc make new maps sharing most of the
+    # trie. The sequence functions see a map as an alist, a list of (key
+    # . value) pairs.
+    __slots__ = ("count",)
+
+    def __init__(self, entries=()):
+        # Make from (key, value) pairs, later pairs replacing earlier ones
+        self.data, self.count = hamt.build(entries)
+
+    @classmethod
+    def of(cls, trie, count):
+        m = cls.__new__(cls)
+        m.data = trie
+        m.count = count
+        return m
+
+    def get(self, key, default=None):
+        return hamt.find(self.data, key, default)
+
+    def contains(self, key):
+        return hamt.find(self.data, key, missing) is not missing
+
+    def assoc(self, key, value):
+        trie, added = hamt.assoc(self.data, key, value)
+        if trie is self.data:
+            return self
+        return self.of(trie, self.count + added)
+
+    def dissoc(self, key):
+        trie = hamt.without(self.data, key)
+        if trie is self.data:
+            return self
+        return self.of(trie, self.count - 1)
+
+    def entries(self):
+        # The key and value of each entry, in no particular order
+        return hamt.entries(self.data)
+
+    def __iter__(self):
+        for key, value in hamt.entries(self.data):
+            yield List.cons(key, value)
+
+    def __eq__(self, other):
+        if other.__class__ != self.__class__ or other.count != self.count:
+            return False
+        for key, value in self.entries():
+            found = other.get(key, missing)
+            if found is missing or not found == value:
+                return False
+        return True
+
+    def __hash__(self):
+        # The same whatever order the entries are in
+        h = 0
+        for key, value in self.entries():
+            h += hash(key) ^ hash(value)
+        return h & 0xffffffff
+
+    def __repr__(self):
+        return '{' + ' '.join(repr(key) + ' ' + repr(value) for key, value in self.entries()) + '}'
+
+    def __str__(self):
+        return repr(self)
+
+    def __reduce__(self):
+        # Pickled as entries, as hashes of some keys change between runs
+        return (self.__class__, (list(self.entries()),))
+
+    def evaluate(self, scope):
+        # Keys and values are evaluated, like the arguments of a call. A
+        # map of values that evaluate to themselves is its own value.
+        entries = []
+        same = True
+        for key, value in self.entries():
+            k, v = key.evaluate(scope), value.evaluate(scope)
+            same = same and k is key and v is value
+            entries.append((k, v))
+        if same:
+            return self
+        return self.__class__(entries)
+
+class Set(Map):
+    # A persistent hash set: a map of each of its items to itself. The
+    # sequence functions see a set as a list of its items.
+    __slots__ = ()
+
+    def __init__(self, items=()):
+        Map.__init__(self, ((x, x) for x in items))
+
+    def conj(self, x):
+        return self.assoc(x, x)
+
+    def __iter__(self):
+        for key, value in hamt.entries(self.data):
+            yield key
+
+    def __hash__(self):
+        h = 0
+        for x in self:
+            h += hash(x)
+        return h & 0xffffffff
+
+    def __repr__(self):
+        return '#{' + ' '.join(repr(x) for x in self) + '}'
+
+    def __reduce__(self):
+        return (Set, (list(self),))
+
+    def evaluate(self, scope):
+        items = []
+        same = True
+        for x in self:
+            y = x.evaluate(scope)
+            same = same and y is x
+            items.append(y)
+        if same:
+            return self
+        return Set(items)
+
+class Vector(Base):
+    # An immutable vector: the items from `start` up to `end` of the
+    # Python list in `data`. Vectors share lists. Adding an item to a
+    # vector that ends where its list does appends to the list, which no
+    # other vector can see, so that a vector built one item at a time
+    # takes amortized O(1) time for each. Otherwise the items are copied.
+    __slots__ = ("start", "end")
+
+    def __init__(self, items=()):
+        self.data = list(items)
+        self.start = 0
+        self.end = len(self.data)
+
+    @staticmethod
+    def of(data, start, end):
+        v = Vector.__new__(Vector)
+        v.data = data
+        v.start = start
+        v.end = end
+        return v
+
+    def count(self):
+        return self.end - self.start
+
+    def nth(self, i, default=None):
+        if 0 <= i < self.end - self.start:
+            return self.data[self.start + i]
+        return default
+
+    def car(self):
+        if self.start == self.end:
+            return List()
+        return self.data[self.start]
+
+    def cdr(self):
+        # The rest shares the list, as with subvec. As with a list, nothing
+        # left is nil, which ends walks such as dolist.
+        if self.end - self.start < 2:
+            return List()
+        return Vector.of(self.data, self.start + 1, self.end)
+
+    def conj(self, x):
+        data = self.data
+        if self.end == len(data):
+            data.append(x)
+            # Unless another thread added to the list first, the vector
+            # made can share it
+            if data[self.end] is x:
+                return Vector.of(data, self.start, self.end + 1)
+        data = data[self.start:self.end] + [x]
+        return Vector.of(data, 0, len(data))
+
+    def subvec(self, start, end):
+        # The items from start up to end, sharing the list
+        if not 0 <= start <= end <= self.end - self.start:
+            raise IndexError("subvec %d to %d out of range of %d items" % (start, end, self.end - self.start))
+        return Vector.of(self.data, self.start + start, self.start + end)
+
+    def __iter__(self):
+        data = self.data
+        for i in xrange(self.start, self.end):
+            yield data[i]
+
+    def __eq__(self, other):
+        if other.__class__ != Vector or other.end - other.start != self.end - self.start:
+            return False
+        for x, y in zip(self, other):
+            if not x == y:
+                return False
+        return True
+
+    def __hash__(self):
+        h = 0x345678
+        for x in self:
+            h = ((h ^ hash(x)) * 1000003) & 0xffffffff
+        return h
+
+    def __repr__(self):
+        return '[' + ' '.join(repr(x) for x in self) + ']'
+
+    def __str__(self):
+        return repr(self)
+
+    def __reduce__(self):
+        return (Vector, (list(self),))
+
+    def evaluate(self, scope):
+        # Items are evaluated, like the arguments of a call. A vector of
+        # values that evaluate to themselves is its own value.
+        items = [x.evaluate(scope) for x in self]
+        for x, y in zip(self, items):
+            if x is not y:
+                return Vector(items)
+        return self
+
+class Stream(Base):
+    # A file, or anything with the methods of one, in `data`. Lines are
+    # read from `source`, which is the file or a memory map of it.
+    #
+    # Output to a buffered stream is kept in `buffer`, a list of strings,
+    # and written to the file in one go once there is `buffer_size` of
+    # it, or when the stream is flushed, as writing to a file costs more
+    # than adding to a list. `buffer` is None for unbuffered streams.
+    # Threads writing at once take turns with `lock`.
+    __slots__ = ("source", "buffer", "size", "lock", "__weakref__")
+
+    buffer_size = 65536
+
+    def __init__(self, f, source=None, buffered=False):
+        self.data = f
+        self.source = source or f
+        self.buffer = None
+        if buffered:
+            self.buffer = []
+            self.lock = threading.Lock()
+        self.size = 0
+
+    def read_line(self):
+        # The next line without its newline, or None at the end
+        line = self.source.readline()
+        if not line:
+            return None
+        if line[-1] == "\n":
+            return line[:-1]
+        return line
+
+    def lines(self):
+        # The rest of the lines, as strings. readline is used rather than
+        # iterating over the file, which reads ahead of the lines it gives.
+        for line in iter(self.source.readline, ""):
+            if line[-1] == "\n":
+                line = line[:-1]
+            yield String(line)
+
+    def write(self, s):
+        if self.buffer is None:
+            self.data.write(s)
+            return
+        with self.lock:
+            self.buffer.append(s)
+            self.size += len(s)
+            if self.size >= self.buffer_size:
+                self.write_buffer()
+
+    def drain(self):
+        # Write out the buffer
+        if self.buffer:
+            with self.lock:
+                self.write_buffer()
+
+    def write_buffer(self):
+        # With the lock held
+        if self.buffer:
+            self.data.write("".join(self.buffer))
+            del(self.buffer[:])
+            self.size = 0
+
+    def flush(self):
+        self.drain()
+        self.data.flush()
+
+    def close(self):
+        self.drain()
+        self.buffer = None
+        if self.source is not self.data:
+            self.source.close()
+        self.data.close()
+
+    def __repr__(self):
+        return "#<stream %s>" % getattr(self.data, "name", "?")
+
+    def __str__(self):
+        return repr(self)
+
+    def evaluate(self, scope):
+        return self
+
+class Future(Base):
+    # The value of an expression evaluated on another thread, the
+    # multiprocessing AsyncResult of which is in `data`
+    __slots__ = ()
+
+    def deref(self):
+        # Waiting with a timeout would poll, which makes every deref of a
+        # future not yet done wait longer than it needs to. An untimed
+        # wait cannot be interrupted, so KeyboardInterrupt is raised once
+        # the future is done.
+        return self.data.get()
+
+    def done(self):
+        return self.data.ready()
+
+    def __repr__(self):
+        if self.done():
+            return "#<future done>"
+        return "#<future pending>"
+
+    def __str__(self):
+        return repr(self)
+
+    def evaluate(self, scope):
+        return self
+
+class TailCall:
+    # A call in tail position. Rather than being made, it is returned to
+    # the trampoline of the nearest non-tail call, so that loops written
+    # as tail recursion run in constant Python stack.
+    def __init__(self, function, scope, args):
+        self.function = function
+        self.scope = scope
+        self.args = args
+
+def trampoline(result):
+    # Make tail calls until there is a result
+    while result.__class__ == TailCall:
+        result = result.function(result.scope, *result.args)
+    return result
+
+class Bindings:
+    # A lambda list, analysed once into the names of its required
+    # arguments, its optional arguments (after `?`) with their default
+    # values, and its rest argument (after `&`)
+    def __init__(self, names):
+        self.required = []
+        self.optional = []
+        self.rest = None
+        if names.__class__ != List:
+            raise SyntaxError("invalid argument list %s" % repr(names))
+        items = list(names)
+        optional = False
+        for i, x in enumerate(items):
+            if x == Symbol('&'):
+                if i + 2 != len(items) or items[i+1].__class__ != Symbol:
+                    raise SyntaxError("expected one symbol after & in %s" % repr(names))
+                self.rest = items[i+1].data
+                break
+            elif x == Symbol('?'):
+                # Every argument after ? is optional
+                optional = True
+            elif optional and x.__class__ == List and x.car().__class__ == Symbol:
+                # An optional argument with a default value
+                self.optional.append((x.car().data, x.cdr().car()))
+            elif x.__class__ != Symbol:
+                raise SyntaxError("invalid argument %s" % repr(x))
+            elif optional:
+                self.optional.append((x.data, None))
+            else:
+                self.required.append(x.data)
+        self.names = self.required + [name for name, default in self.optional]
+        if self.rest is not None:
+            self.names.append(self.rest)
+
+    @staticmethod
+    def of(names):
+        # Lambda lists are analysed once, and kept with the list
+        if names.__class__ != List or getattr(names, "plan", None) is None:
+            names.plan = Bindings(names)
+        return names.plan
+
+    def check(self, count):
+        # Raise if count arguments do not fit
+        required = len(self.required)
+        if count >= required and (self.rest is not None or count <= required + len(self.optional)):
+            return
+        if self.rest is not None:
+            raise TypeError("expected at least %d arguments, got %d" % (required, count))
+        elif len(self.optional):
+            raise TypeError("expected %d to %d arguments, got %d" % (required, required + len(self.optional), count))
+        else:
+            raise TypeError("expected %d arguments, got %d" % (required, count))
+
+    def bind(self, scope, args, evaluate):
+        # Bind args in scope. Missing optional arguments get their default
+        # value, evaluated in scope if evaluate is true, or nil.
+        self.check(len(args))
+        bindings = scope.bindings
+        i = 0
+        for name in self.required:
+            bindings[name] = args[i]
+            i += 1
+        for name, default in self.optional:
+            if i < len(args):
+                bindings[name] = args[i]
+                i += 1
+            elif default is None:
+                bindings[name] = List()
+            elif evaluate:
+                bindings[name] = default.evaluate(scope)
+            else:
+                bindings[name] = default
+        if self.rest is not None:
+            bindings[self.rest] = List(list(args[i:]) + [[]])
+
 class Lambda:
+    # The symbol def first bound the lambda to
+    name = None
+    # How many of the profiler and metrics (see profiler.py and
+    # metrics.py) have replaced invoke to record calls. Compiled code
+    # calls lambdas through invoke while any have.
+    traced = 0
+
     def __init__(self, scope, bindings, body):
         self.bindings = bindings
+        self.plan = Bindings.of(bindings)
         self.body = body
         self.scope = scope
-        self.meta = {"name": None}
+        # Where the lambda list was read from
+        self.position = getattr(bindings, "position", None)
+        # For lambdas made by compiled code, the compiled entry point and
+        # the frame they were made in (see compiler.py)
+        self.code = None
+        self.frame = None
+
+    def __getstate__(self):
+        # Compiled code cannot be pickled, see image.py
+        state = self.__dict__.copy()
+        state["code"] = None
+        return state
+
+    @property
+    def meta(self):
+        meta = make_meta(self.position)
+        meta["name"] = self.name
+        return meta
 
     def evaluate(self, scope):
         return self
 
     def __call__(self, scope, *args):
-        #if scope.has_key("recur") and scope["recur"] == self:
-            # This is recursion, don't create a new scope
-            #local = scope
-        #else:
+        # Evaluate the arguments in the calling scope
+        return self.invoke(scope, *[x.evaluate(scope) for x in args])
+
+    def invoke(self, scope, *args):
+        # Call with arguments which are already evaluated
+        if self.code is not None:
+            return self.code(self, args)
         # Calling scope -> creating scope -> local scope
         # Clone creation scope so its parent can be set to calling scope
-        creation = Scope()
-        creation.bindings = self.scope.bindings
-        creation.parent = scope
+        creation = self.scope.clone(scope)
+        if scope.has_key("recur") and scope["recur"] is self:
+            # This is recursion. The new local scope shadows everything
+            # bound in the calling one, so skip it, and the scope chain
+            # does not grow with each iteration of a loop.
+            creation.parent = scope.parent.parent
         # Create a new scope
         local = Scope(creation)
         # Bind `recur` to self (to alow for recursion from anonymous functions)
         local["recur"] = self
         # Bind each argument to a binding
-        bi = ai = 0
-        bindings = self.bindings.data[:-1]
-        while bi != len(bindings) and ai != len(bindings):
-            # Optional argument
-            if bindings[bi] == Symbol('?'):
-                if ai >= len(args):
-                    if bindings[bi+1].__class__ == List:
-                        # A default value is supplied
-                        local[bindings[bi+1].car().data] = bindings[bi+1].cdr().car().evaluate(local)
-                    else:
-                        # Nothing supplied for this optional and no default value
-                        local[bindings[bi+1].data] = List([])
-                    ai -= 1
-                    bi += 1
-                else:
-                    if bindings[bi+1].__class__ == List:
-                        # A default value is supplied, replace with just the symbol
-                        local[bindings[bi+1].car().data] = args[ai].evaluate(scope)
-                    else:
-                        local[bindings[bi+1].data] = args[ai].evaluate(scope)
-                    bi += 1
-                    #continue
-            # Rest argument
-            elif bindings[bi] == Symbol('&'):
-                if ai == len(args):
-                    #raise TypeError("expected at least %d arguments, got %d" % (bi + 1, ai))
-                    local[bindings[bi+1].data] = List([])
-                else:
-                    local[bindings[bi+1].data] = List([x.evaluate(scope) for x in args[ai:]] + [[]])
-                break
-            # Normal argument
-            else:
-                # Too many or too few arguments
-                if bi >= len(bindings) or ai >= len(args):
-                    raise TypeError("expected %d arguments, got %d" % (len(bindings), len(args)))
-                local[bindings[bi].data] = args[ai].evaluate(scope)
-            ai += 1
-            bi += 1
+        self.plan.bind(local, args, True)
         # Evaluate each expression in the body (in local function scope)
         for expression in self.body[:-1]:
             expression.evaluate(local)
-        # Return the evaluated last expression
-        return self.body[-1].evaluate(local)
+        # Return the evaluated last expression, in tail position
+        return self.body[-1].evaluate_tail(local)
 
 class Macro(Lambda):
+    # Expansions performed, and expansions reused from a call site's cache
+    expansions = 0
+    cache_hits = 0
+
     def __call__(self, scope, *args):
+        # Evaluate the expansion in the outer scope
+        return self.expand(scope, *args).evaluate(scope)
+
+    def expand_form(self, scope, form):
+        # Expansions are cached on the call-site form, keyed on the macro
+        # that produced them. Rebinding the macro's symbol (set!, undef!)
+        # means a different macro is found there, so the form is expanded
+        # again. This assumes macros are pure functions of their arguments.
+        cached = getattr(form, "expansion", None)
+        if cached is not None and cached[0] is self:
+            Macro.cache_hits += 1
+            return cached[1]
+        expansion = self.expand(scope, *form.tail)
+        form.expansion = (self, expansion)
+        return expansion
+
+    def expand(self, scope, *args):
         # Create a new function-local scope
         local = Scope(scope)
-        # Bind each argument to a binding
-        bindings = self.bindings.data[:-1]
-        bi = ai = 0
-        while bi != len(bindings) and ai != len(bindings):
-            # Optional argument
-            if bindings[bi] == Symbol('?'):
-                if ai >= len(args):
-                    if bindings[bi+1].__class__ == List:
-                        # A default value is supplied
-                        local[bindings[bi+1].car().data] = bindings[bi+1].cdr().car()
-                    else:
-                        # Nothing supplied for this optional and no default value
-                        local[bindings[bi+1].data] = List([])
-                    ai -= 1
-                    bi += 1
-                else:
-                    if bindings[bi+1].__class__ == List:
-                        # A default value is supplied, replace with just the symbol
-                        local[bindings[bi+1].car().data] = args[ai]
-                    else:
-                        local[bindings[bi+1].data] = args[ai]
-                    bi += 1
-                    #continue
-            # Rest argument
-            elif bindings[bi] == Symbol('&'):
-                if ai == len(args):
-                    #raise TypeError("expected at least %d arguments, got %d" % (bi + 1, ai))
-                    local[bindings[bi+1].data] = List([])
-                else:
-                    local[bindings[bi+1].data] = List(list(args[ai:]) + [[]])
-                break
-            # Normal argument
-            else:
-                # Too many or too few arguments
-                if bi == len(bindings) or ai == len(args):
-                    raise TypeError("expected %d arguments, got %d" % (len(bindings), len(args)))
-                local[bindings[bi].data] = args[ai]
-            ai += 1
-            bi += 1
+        # Bind each argument to a binding, leaving default values unevaluated
+        self.plan.bind(local, args, False)
         # Evaluate each expression in the body (in local function scope)
         for expression in self.body[:-1]:
             expression.evaluate(local)
-        # Return the evaluated last expression after evaluating it again in the outer scope
-        return self.body[-1].evaluate(local).evaluate(scope)
+        Macro.expansions += 1
+        # Return the evaluated last expression
+        return self.body[-1].evaluate(local)
+
+class Value(Base):
+    # An evaluated argument, for passing values to builtins that evaluate
+    # their arguments
+    __slots__ = ()
+
+    def __init__(self, data):
+        self.data = data
+
+    def evaluate(self, scope):
+        return self.data
+
+# Values that evaluate to themselves can be passed to builtins as they are
+# (lazy sequences are not, see evaluate_once in core.py)
+self_evaluating = set([Number, Keyword, Character, String, Stream, Future, Lambda, Macro])
+
+def wrap(value):
+    if value.__class__ in self_evaluating:
+        return value
+    return Value(value)
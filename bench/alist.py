@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Association list benchmark: looks up every key of alists of keyword
+# and symbol keys, by comparing keys with == from Python, with the
+# contains? builtin and with get from core.lisp, and reports the time per
+# key compared, the best of three.
+
+import sys
+import time
+
+from common import load_core, lispy
+from ast import *
+from reader import Reader
+import core
+
+def alist(n, key):
+    # Keys are read, as they would be in a program
+    source = "'(%s)" % " ".join("(%s . %d)" % (key % i, i) for i in range(n))
+    expr, = Reader(source).read()
+    return expr.evaluate(core.scope)
+
+def scan(keys):
+    for key in keys:
+        for x in keys:
+            if x == key:
+                break
+
+lookups = [
+    ("==", [100, 200, 400], scan),
+    ("contains?", [100, 200, 400], lispy("(contains? ks k)", "k")),
+    ("get", [100, 200], lispy("(get alist k)", "k")),
+]
+
+def timed(f, keys):
+    # Seconds per lookup of every key, running each lookup for at least
+    # a tenth of a second
+    times = []
+    for i in range(3):
+        runs = 0
+        start = time.time()
+        while not runs or time.time() - start < 0.1:
+            f(keys)
+            runs += 1
+        times.append((time.time() - start) / runs)
+    return min(times)
+
+def main():
+    sys.setrecursionlimit(100000)
+    load_core()
+    for name, key in [("keyword keys", ":key-%d"), ("symbol keys", "key-%d")]:
+        for function, sizes, f in lookups:
+            print "%s, %s" % (name, function)
+            for n in sizes:
+                xs = alist(n, key)
+                core.scope["alist"] = xs
+                keys = [x.car() for x in xs]
+                core.scope["ks"] = List(keys + [[]])
+                elapsed = timed(f, keys)
+                # Looking up the i-th key compares i + 1 keys
+                comparisons = n * (n + 1) / 2
+                print "  %4d keys  %8.3fs  %7.3fus/key" % (n, elapsed, elapsed / comparisons * 1e6)
+
+if __name__ == "__main__":
+    main()
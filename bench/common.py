@@ -0,0 +1,39 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# What the benchmarks that run Lispy in their own process share.
+# Importing this puts the interpreter's modules on the path.
+
+import os
+import resource
+import sys
+
+bench = os.path.dirname(os.path.abspath(__file__))
+root = os.path.join(bench, "..")
+sys.path.insert(0, root)
+
+from reader import Reader
+import core
+
+def peak():
+    # The peak memory of the process, in bytes; Linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def load(filename):
+    # Evaluate every form of a file in the global scope
+    f = open(filename)
+    for expr in Reader(f.read(), filename).read():
+        expr.evaluate(core.scope)
+    f.close()
+
+def load_core():
+    load(os.path.join(root, "core.lisp"))
+
+def lispy(source, name):
+    # Evaluates source with name bound to each value in turn
+    expr, = Reader(source).read()
+    def run(values):
+        for value in values:
+            core.scope[name] = value
+            expr.evaluate(core.scope)
+    return run
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Engine benchmark: runs the same expressions with the tree-walking and
+# the compiled engine, side by side. Times include interpreter startup.
+
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+workloads = [
+    ("startup", "nil"),
+    ("reduce/range", "(reduce + (range 20000))"),
+    ("fib", "(do (defn fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib 18))"),
+    ("map/filter", "(dolist (i (range 100)) (count (filter even? (map (fn (x) (* x 3)) (range 60)))))"),
+]
+
+def run(engine, expr):
+    start = time.time()
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py"), "--engine=" + engine,
+                           "-c", os.path.join(root, "core.lisp"), "-e", expr],
+                          stdout=open(os.devnull, "w"))
+    return time.time() - start
+
+def main():
+    print "%-16s %10s %10s %8s" % ("workload", "tree", "compiled", "speedup")
+    for name, expr in workloads:
+        tree = run("tree", expr)
+        compiled = run("compiled", expr)
+        print "%-16s %9.3fs %9.3fs %7.2fx" % (name, tree, compiled, tree / compiled)
+
+if __name__ == "__main__":
+    main()
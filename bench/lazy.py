@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Lazy sequence benchmark: runs a range, filter, map and reduce pipeline
+# over increasing numbers of items, each in a new interpreter, and
+# reports the time and the peak memory of the interpreter. A pipeline
+# that streams its items keeps the peak memory flat.
+
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+pipeline = "(reduce + (map (fn (x) (* x 2)) (filter even? (range %d))))"
+
+def run(engine, n):
+    # Peak memory of the children so far is all ru_maxrss gives, so each
+    # run is measured in a child of its own
+    code = """
+import resource, subprocess, sys
+subprocess.check_call(sys.argv[1:], stdout=open('/dev/null', 'w'))
+print resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+"""
+    start = time.time()
+    peak = subprocess.check_output([sys.executable, "-c", code, sys.executable,
+                                    os.path.join(root, "lispy.py"), "--engine=" + engine,
+                                    "-e", pipeline % n])
+    return time.time() - start, int(peak) / 1024.0
+
+def main():
+    engine = "compiled"
+    if len(sys.argv) > 1:
+        engine = sys.argv[1]
+    print pipeline % 0
+    for n in [10000, 100000, 1000000]:
+        elapsed, peak = run(engine, n)
+        print "  %8d items  %8.3fs  %6.1fMB peak" % (n, elapsed, peak)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# List walking benchmark: walks lists of increasing length with cdr, the
+# way map, filter and reduce in core.lisp do, and reports the time per
+# element. Linear walks keep the time per element flat as lists grow.
+
+import sys
+import threading
+import time
+
+from common import load_core
+from ast import *
+from reader import Reader
+import core
+
+def build(n):
+    return List([Number(i) for i in range(n)] + [[]])
+
+def walk(xs):
+    while not xs == core.nil:
+        xs.car()
+        xs = xs.cdr()
+
+def lispy(source, xs):
+    core.scope["xs"] = xs
+    for expr in Reader(source).read():
+        expr.evaluate(core.scope)
+
+def timed(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def report(name, sizes, f):
+    print name
+    for n in sizes:
+        xs = build(n)
+        elapsed = timed(f, xs)
+        print "  %7d elements  %8.3fs  %6.2fus/element" % (n, elapsed, elapsed / n * 1e6)
+
+def main():
+    load_core()
+    report("cdr walk", [25000, 50000, 100000], walk)
+    # The recursive core.lisp functions need a deep Python stack
+    report("(map inc xs)", [1000, 2000, 4000], lambda xs: lispy("(map (fn (x) (inc x)) xs)", xs))
+    report("(reduce + xs)", [1000, 2000, 4000], lambda xs: lispy("(reduce + xs)", xs))
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(1000000)
+    threading.stack_size(512 * 1024 * 1024)
+    thread = threading.Thread(target=main)
+    thread.start()
+    thread.join()
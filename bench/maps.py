@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Map benchmark: builds lookup tables of keyword keys with assoc, and
+# looks up every key with get, as maps and as alists, and reports the
+# time per key. Also reads a map literal of the largest size. Alists are
+# only timed up to 2000 keys, as their lookups take O(n) time.
+
+import sys
+import time
+
+from common import load_core, lispy
+from ast import *
+from reader import Reader
+import core
+
+def keywords(n):
+    return [Keyword("key-%d" % i) for i in range(n)]
+
+def timed(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def report(name, n, elapsed):
+    print "  %-14s %7d keys  %8.3fs  %7.2fus/key" % (name, n, elapsed, elapsed / n * 1e6)
+
+def main():
+    load_core()
+    build = lispy("(set! table (assoc table k k))", "k")
+    lookup = lispy("(get table k)", "k")
+    for name, empty, sizes in [("map", Map(), [1000, 10000, 100000]), ("alist", core.nil, [500, 1000, 2000])]:
+        print name
+        for n in sizes:
+            ks = keywords(n)
+            core.scope["table"] = empty
+            report("assoc", n, timed(build, ks))
+            report("get", n, timed(lookup, ks))
+    n = 100000
+    source = "{%s}" % " ".join(":key-%d %d" % (i, i) for i in range(n))
+    print "map literal"
+    report("read", n, timed(lambda: Reader(source).read()))
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(100000)
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Memory benchmark: reads a quoted list of a million numbers, symbols,
+# keywords and characters, and reports the growth of the process (peak
+# resident set size) per node read, cons cells included.
+
+from common import peak
+from reader import Reader
+
+def item(i):
+    kind = i % 4
+    if kind == 0:
+        return "%d" % i
+    elif kind == 1:
+        return "foo-%d" % i
+    elif kind == 2:
+        return ":key-%d" % i
+    return "\\x"
+
+def data(n):
+    # Ten items a line
+    lines = [" ".join([item(j) for j in xrange(i, min(i + 10, n))]) for i in xrange(0, n, 10)]
+    return "'(" + "\n".join(lines) + ")"
+
+def main():
+    n = 1000000
+    text = data(n)
+    before = peak()
+    # The forms are kept alive until the peak is measured
+    exprs = Reader(text, "data.lisp").read()
+    after = peak()
+    del exprs
+    # Each item is an atom and a cons cell
+    nodes = 2 * n
+    print "%d nodes  %.1fMB  %.1f bytes/node" % (nodes, (after - before) / 1e6,
+                                               float(after - before) / nodes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Output benchmark: prints a million short lines with println, printf and
+# print of str, to a file, and reports the time each took. Lispy runs in
+# a new interpreter each time, whose startup is measured and left out.
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+runs = 3
+
+programs = [
+    ("println", '(dolist (i (range %d)) (println i))'),
+    ("printf", '(dolist (i (range %d)) (printf "line %%d\\n" i))'),
+    ("print str", '(dolist (i (range %d)) (print (str "line " i "\\n")))'),
+]
+
+def lispy(engine, code, out):
+    start = time.time()
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py"), "--engine=" + engine, "-e", code],
+                          stdout=out)
+    return time.time() - start
+
+def best(f):
+    return min(f() for i in range(runs))
+
+def main():
+    engine = "compiled"
+    n = 1000000
+    if len(sys.argv) > 1:
+        engine = sys.argv[1]
+    if len(sys.argv) > 2:
+        n = int(sys.argv[2])
+    fd, filename = tempfile.mkstemp()
+    out = os.fdopen(fd, "w")
+    try:
+        startup = best(lambda: lispy(engine, "nil", out))
+        print "%d lines, %s engine" % (n, engine)
+        for name, program in programs:
+            elapsed = best(lambda: lispy(engine, program % n, out)) - startup
+            print "  %-10s %8.3fs  %6.2fus/line" % (name, elapsed, elapsed * 1e6 / n)
+    finally:
+        out.close()
+        os.remove(filename)
+
+if __name__ == "__main__":
+    main()
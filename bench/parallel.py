@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Parallel benchmark: applies a CPU-bound function to a list of items
+# with map, and with pmap in increasing numbers of processes, and reports
+# the time each took and the speedup of pmap over map. Lispy runs in a
+# new interpreter each time, whose startup is measured and left out.
+
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+runs = 3
+
+program = """
+(defn work (n) (reduce + (map (fn (x) (* x x)) (range n))))
+(%s work (take %d (iterate identity %d)))
+"""
+
+def lispy(engine, jobs, code):
+    start = time.time()
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py"), "--engine=" + engine,
+                           "--jobs=%d" % jobs, "-e", "(do %s)" % code],
+                          stdout=open(os.devnull, "w"))
+    return time.time() - start
+
+def best(f):
+    return min(f() for i in range(runs))
+
+def main():
+    engine = "compiled"
+    items, size = 64, 20000
+    if len(sys.argv) > 1:
+        engine = sys.argv[1]
+    startup = best(lambda: lispy(engine, 1, "nil"))
+    serial = best(lambda: lispy(engine, 1, program % ("map", items, size))) - startup
+    print "%d items of %d, %s engine" % (items, size, engine)
+    print "  %-10s %8.3fs" % ("map", serial)
+    # With --jobs=1, pmap does not start any workers
+    for jobs in [2, 4, 8]:
+        elapsed = best(lambda: lispy(engine, jobs, program % ("pmap", items, size))) - startup
+        print "  %-10s %8.3fs  %5.2fx" % ("pmap -j%d" % jobs, elapsed, serial / elapsed)
+
+if __name__ == "__main__":
+    main()
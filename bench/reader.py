@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Reader throughput benchmark: reads a few megabytes of source (core.lisp
+# over and over) and of data (records of numbers, strings, keywords and
+# symbols), and reports megabytes read per second. Each is read all at
+# once, and streamed in 64KB chunks with the forms thrown away as they are
+# read, and the peak memory use of the process is shown after each.
+
+import os
+import resource
+import time
+
+from common import root
+from reader import Reader
+
+def source(size):
+    f = open(os.path.join(root, "core.lisp"))
+    core = f.read()
+    f.close()
+    return core * (size / len(core) + 1)
+
+def data(size):
+    record = '(:id %d :name "item %d" :price %d.%02d :tags (foo bar-%d) :next -%d)\n'
+    records = []
+    length = 0
+    i = 0
+    while length < size:
+        records.append(record % (i, i, i, i % 100, i % 7, i))
+        length += len(records[-1])
+        i += 1
+    return "".join(records)
+
+def whole(text):
+    Reader(text).read()
+
+def streamed(text):
+    chunks = [text[i:i+65536] for i in range(0, len(text), 65536)]
+    for form in Reader().forms(chunks):
+        pass
+
+def report(name, read, text):
+    start = time.time()
+    read(text)
+    elapsed = time.time() - start
+    megabytes = len(text) / 1e6
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    print "%-16s %6.2fMB  %8.3fs  %6.2fMB/s  %6.0fMB peak" % (name, megabytes, elapsed,
+                                                             megabytes / elapsed, peak)
+
+def main():
+    size = 4 * 1000 * 1000
+    texts = [("source", source(size)), ("data", data(size))]
+    # Streams first, as the peak only goes up
+    for name, text in texts:
+        report(name + " streamed", streamed, text)
+    for name, text in texts:
+        report(name, whole, text)
+
+if __name__ == "__main__":
+    main()
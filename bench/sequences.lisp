@@ -0,0 +1,72 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; The sequence functions core.lisp used to define, renamed with a lispy-
+;; prefix, for bench/sequences.py to compare with the builtins.
+
+(defn lispy-reduce (f xs ? (x :not-supplied))
+  (if (= x :not-supplied)
+    (lispy-reduce f (cdr xs) (car xs))
+    (if (nil? (cdr xs))
+      (f x (car xs))
+      (lispy-reduce f (cdr xs) (f x (car xs))))))
+
+(defn lispy-filter (p xs)
+  (if (nil? xs)
+    xs
+    (if (p (car xs))
+      (cons (car xs) (lispy-filter p (cdr xs)))
+      (lispy-filter p (cdr xs)))))
+
+(defn lispy-map (f xs)
+  (if (nil? xs)
+    xs
+    (cons (f (car xs)) (lispy-map f (cdr xs)))))
+
+(defn lispy-contains? (xs key)
+  (if (nil? xs)
+    nil
+    (if (= (car xs) key)
+      t
+      (lispy-contains? (cdr xs) key))))
+
+(defn lispy-count (xs)
+  (lispy-reduce (fn (acc _) (inc acc)) xs 0))
+
+(defn lispy-nth (xs i)
+  (if (zero? i)
+    (car xs)
+    (lispy-nth (cdr xs) (dec i))))
+
+(defn lispy-last (xs)
+  (if (nil? (cdr xs))
+    (car xs)
+    (lispy-last (cdr xs))))
+
+(defn lispy-append (xs y)
+  (if (nil? xs)
+    (cons y nil)
+    (cons (car xs) (lispy-append (cdr xs) y))))
+
+(defn lispy-concat (xs ys)
+  (if (nil? xs)
+    ys
+    (cons (car xs) (lispy-concat (cdr xs) ys))))
+
+(defn lispy-reverse (xs)
+  (lispy-reduce (fn (acc x) (cons x acc)) xs nil))
+
+(defn lispy-range (min ? max)
+  (if (nil? max)
+    (lispy-range 0 min)
+    ((fn (i acc)
+       (if (< i min)
+         acc
+         (recur (dec i) (cons i acc))))
+     (dec max) nil)))
+
+(defn lispy-str-to-list (str)
+  (if (= str "")
+    nil
+    (cons (car str) (lispy-str-to-list (cdr str)))))
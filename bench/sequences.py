@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Sequence function benchmark: times the builtin sequence functions
+# against the Lispy definitions core.lisp used to have (sequences.lisp),
+# on lists of 10000 and 100000 numbers, or of the sizes given as
+# arguments. A Lispy definition that runs out of stack shows as "-".
+
+import os
+import sys
+import threading
+import time
+
+from common import bench, load, load_core
+from ast import *
+from reader import Reader
+import core
+
+# Calls, with F standing for the function
+calls = [
+    ("map", "(F (fn (x) (+ x 1)) xs)"),
+    ("filter", "(F even? xs)"),
+    ("reduce", "(F + xs)"),
+    ("count", "(F xs)"),
+    ("nth", "(F xs (- n 1))"),
+    ("last", "(F xs)"),
+    ("append", "(F xs 0)"),
+    ("concat", "(F xs xs)"),
+    ("reverse", "(F xs)"),
+    ("range", "(count (F n))"),
+    ("contains?", "(F xs -1)"),
+    ("str-to-list", "(F s)"),
+]
+
+def timed(source):
+    expr, = Reader(source).read()
+    start = time.time()
+    try:
+        expr.evaluate(core.scope)
+    except RuntimeError:
+        # Maximum recursion depth exceeded
+        return None
+    return time.time() - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    load_core()
+    load(os.path.join(bench, "sequences.lisp"))
+    print "%-12s %7s %10s %10s %9s" % ("function", "size", "lispy", "builtin", "speedup")
+    for n in sizes:
+        core.scope["n"] = Number(n)
+        core.scope["xs"] = List([Number(i) for i in range(n)] + [[]])
+        core.scope["s"] = String("x" * n)
+        for name, call in calls:
+            lispy = timed(call.replace("F", "lispy-" + name))
+            builtin = timed(call.replace("F", name))
+            if lispy is None:
+                print "%-12s %7d %10s %9.3fs %9s" % (name, n, "-", builtin, "-")
+            else:
+                print "%-12s %7d %9.3fs %9.3fs %8.0fx" % (name, n, lispy, builtin, lispy / builtin)
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(1000000)
+    threading.stack_size(512 * 1024 * 1024)
+    thread = threading.Thread(target=main)
+    thread.start()
+    thread.join()
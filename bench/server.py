@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Server benchmark: the time a small expression takes to evaluate with a
+# new interpreter (`lispy -e`), with the client of a server (`server.py
+# SOCKET -e`), and sent straight to the server's socket, as a program
+# that keeps its connection code loaded would.
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import root
+import server
+
+runs = 50
+
+expr = "(+ 1 2)"
+
+def lispy(args):
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py")] + args,
+                          stdout=open(os.devnull, "w"))
+
+def client(path):
+    subprocess.check_call([sys.executable, os.path.join(root, "server.py"), path, "-e", expr],
+                          stdout=open(os.devnull, "w"))
+
+def direct(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(server.write_request({"evaluate": expr, "cwd": root}))
+    s.shutdown(socket.SHUT_WR)
+    while s.recv(65536):
+        pass
+    s.close()
+
+def mean(f):
+    start = time.time()
+    for i in range(runs):
+        f()
+    return (time.time() - start) / runs
+
+def main():
+    engine = "compiled"
+    if len(sys.argv) > 1:
+        engine = sys.argv[1]
+    temp = tempfile.mkdtemp()
+    path = os.path.join(temp, "lispy.sock")
+    p = subprocess.Popen([sys.executable, os.path.join(root, "lispy.py"), "--engine=" + engine,
+                          "--server=" + path], cwd=root)
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        print "%s engine, per evaluation" % engine
+        print "  %-10s %8.1fms" % ("lispy -e", mean(lambda: lispy(["--engine=" + engine, "-e", expr])) * 1000)
+        print "  %-10s %8.1fms" % ("client", mean(lambda: client(path)) * 1000)
+        print "  %-10s %8.1fms" % ("socket", mean(lambda: direct(path)) * 1000)
+    finally:
+        p.terminate()
+        p.wait()
+        shutil.rmtree(temp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Startup benchmark: times `lispy -e nil` with no core, with a cold start
+# (no image, so the core is evaluated and its image saved) and with a warm
+# start (the core loaded from its image), for each engine.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+runs = 10
+
+def run(args):
+    start = time.time()
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py")] + args + ["-e", "nil"],
+                          stdout=open(os.devnull, "w"))
+    return time.time() - start
+
+def best(args, before=None):
+    times = []
+    for i in range(runs):
+        if before is not None:
+            before()
+        times.append(run(args))
+    return min(times)
+
+def main():
+    # Work on a copy of the core, so its image is our own
+    temp = tempfile.mkdtemp()
+    core = os.path.join(temp, "core.lisp")
+    shutil.copy(os.path.join(root, "core.lisp"), core)
+    def remove_image():
+        if os.path.exists(core + "c"):
+            os.remove(core + "c")
+    try:
+        print "%-10s %10s %10s %10s" % ("engine", "no core", "cold", "warm")
+        for engine in ("tree", "compiled"):
+            args = ["--engine=" + engine, "-c", core]
+            none = best(["--engine=" + engine, "-n"])
+            cold = best(args, remove_image)
+            warm = best(args)
+            print "%-10s %9.3fs %9.3fs %9.3fs" % (engine, none, cold, warm)
+    finally:
+        shutil.rmtree(temp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Stream benchmark: reads a generated log file line by line and whole, in
+# Lispy and in plain Python, and reports the throughput of each in MB/s.
+# Lispy runs in a new interpreter each time, whose startup is measured
+# and left out.
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+runs = 3
+
+line = "2010-06-01 12:00:00 INFO  request served in 12ms from 10.0.0.1 GET /index.html\n"
+
+programs = [
+    ("line-seq", '(with-open ((f (open "%s"))) (count (line-seq f)))'),
+    ("read-line", '(with-open ((f (open "%s"))) ((fn (n) (if (read-line f) (recur (inc n)) n)) 0))'),
+    ("read-file", '(count (read-file "%s"))'),
+]
+
+def lispy(engine, code):
+    start = time.time()
+    subprocess.check_call([sys.executable, os.path.join(root, "lispy.py"), "--engine=" + engine, "-e", code],
+                          stdout=open(os.devnull, "w"))
+    return time.time() - start
+
+def best(f):
+    return min(f() for i in range(runs))
+
+def python_lines(filename):
+    start = time.time()
+    n = 0
+    f = open(filename)
+    for l in f:
+        n += 1
+    f.close()
+    return time.time() - start
+
+def python_read(filename):
+    start = time.time()
+    f = open(filename)
+    len(f.read())
+    f.close()
+    return time.time() - start
+
+def main():
+    engine = "compiled"
+    size = 20
+    if len(sys.argv) > 1:
+        engine = sys.argv[1]
+    if len(sys.argv) > 2:
+        size = int(sys.argv[2])
+    fd, filename = tempfile.mkstemp(suffix=".log")
+    f = os.fdopen(fd, "w")
+    f.write(line * (size * 1000000 / len(line)))
+    f.close()
+    mb = os.path.getsize(filename) / 1e6
+    try:
+        startup = best(lambda: lispy(engine, "nil"))
+        print "%.1fMB, %s engine" % (mb, engine)
+        print "  %-18s %8.1fMB/s" % ("python lines", mb / best(lambda: python_lines(filename)))
+        print "  %-18s %8.1fMB/s" % ("python read", mb / best(lambda: python_read(filename)))
+        for name, program in programs:
+            elapsed = best(lambda: lispy(engine, program % filename)) - startup
+            print "  %-18s %8.1fMB/s" % (name, mb / elapsed)
+    finally:
+        os.remove(filename)
+
+if __name__ == "__main__":
+    main()
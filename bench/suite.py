@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Benchmark suite: runs each workload a number of times, each time in a
+# new interpreter, and reports the median and 95th percentile of the
+# time it took and the peak memory of the interpreter. The workloads are
+# the Lispy programs in bench/suite, timed once the core is loaded;
+# reading a few megabytes of source; and loading the core from its
+# image. The results can be saved as a JSON baseline, and compared with
+# one, flagging workloads slower or bigger than it by more than a
+# threshold, in which case the exit status is 1.
+#
+#     python bench/suite.py --save=baseline.json
+#     python bench/suite.py --compare=baseline.json
+#
+# Baselines are only comparable on the same machine and engine.
+
+import os
+import sys
+import json
+import math
+import getopt
+import subprocess
+import tempfile
+import time
+
+from common import bench, peak, root
+core_filename = os.path.join(root, "core.lisp")
+
+runs = 10
+# Slower or bigger than the baseline by more than this is a regression
+threshold = 0.1
+engine = "tree"
+
+programs = sorted(os.path.splitext(name)[0] for name in os.listdir(os.path.join(bench, "suite"))
+                  if name.endswith(".lisp"))
+workloads = programs + ["reader", "startup"]
+
+def measure(name, source):
+    # In the interpreter made for a run, run a workload and report the
+    # time it took and the peak memory
+    from reader import Reader
+    import lispy
+    import core
+    lispy.engine = engine
+    if name == "startup":
+        start = time.time()
+        lispy.load_lisp_core(core_filename)
+        elapsed = time.time() - start
+    else:
+        lispy.load_lisp_core(core_filename)
+        if name == "reader":
+            filename = source
+        else:
+            filename = os.path.join(bench, "suite", name + ".lisp")
+        f = open(filename)
+        start = time.time()
+        forms = Reader(filename=filename).forms(lispy.chunks(f))
+        if name == "reader":
+            for form in forms:
+                pass
+        else:
+            for form in forms:
+                lispy.evaluate_form(form)
+        core.flush_output()
+        elapsed = time.time() - start
+        f.close()
+    print json.dumps({"time": elapsed, "memory": peak()})
+
+def run(name, source):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--engine=" + engine,
+                                      "--measure=" + name, "--source=" + source])
+    return json.loads(output.splitlines()[-1])
+
+def median(xs):
+    xs = sorted(xs)
+    middle = len(xs) / 2
+    if len(xs) % 2:
+        return xs[middle]
+    return (xs[middle - 1] + xs[middle]) / 2.0
+
+def percentile(xs, p):
+    # Nearest rank
+    xs = sorted(xs)
+    return xs[max(int(math.ceil(p / 100.0 * len(xs))) - 1, 0)]
+
+def reader_source():
+    # A few megabytes of source to read, the core over and over
+    f = open(core_filename)
+    text = f.read()
+    f.close()
+    fd, filename = tempfile.mkstemp(suffix=".lisp")
+    f = os.fdopen(fd, "w")
+    f.write(text * (2000000 / len(text)))
+    f.close()
+    return filename
+
+def change(new, old):
+    if not old:
+        return 0.0
+    return (new - old) / float(old)
+
+def help():
+    print "Usage: %s [options] [workload...]" % sys.argv[0]
+    print "Options:"
+    print "  --engine=ENGINE      Run the workloads with the tree (default) or the"
+    print "                       compiled engine"
+    print "  --runs=N             Run each workload N times (default: %d)" % runs
+    print "  --save=FILE          Save the results as a baseline"
+    print "  --compare=FILE       Compare the results with a baseline"
+    print "  --threshold=PERCENT  Flag workloads slower or bigger than the baseline by"
+    print "                       more than PERCENT (default: %d)" % (threshold * 100)
+    print "Workloads: %s" % " ".join(workloads)
+    print
+
+def main(argv):
+    global engine, runs, threshold
+    try:
+        opts, args = getopt.getopt(argv, "h", ["engine=", "runs=", "save=", "compare=", "threshold=",
+                                               "measure=", "source=", "help"])
+    except getopt.GetoptError, err:
+        print '%s\n' % err
+        help()
+        sys.exit(1)
+    save = compare = measured = source = None
+    for opt, arg in opts:
+        if opt == "--engine":
+            if arg not in ("tree", "compiled"):
+                print "Unknown engine %s\n" % repr(arg)
+                help()
+                sys.exit(1)
+            engine = arg
+        elif opt == "--runs":
+            if not arg.isdigit() or int(arg) < 1:
+                print "Expected a number of runs, got %s\n" % repr(arg)
+                help()
+                sys.exit(1)
+            runs = int(arg)
+        elif opt == "--save":
+            save = arg
+        elif opt == "--compare":
+            compare = arg
+        elif opt == "--threshold":
+            threshold = float(arg) / 100
+        elif opt == "--measure":
+            measured = arg
+        elif opt == "--source":
+            source = arg
+        elif opt in ("-h", "--help"):
+            help()
+            sys.exit()
+    if measured is not None:
+        measure(measured, source)
+        return
+    for name in args:
+        if name not in workloads:
+            print "Unknown workload %s\n" % repr(name)
+            help()
+            sys.exit(1)
+    names = args or workloads
+
+    baseline = None
+    if compare is not None:
+        f = open(compare)
+        baseline = json.load(f)
+        f.close()
+        if baseline["engine"] != engine:
+            print "The baseline is of the %s engine\n" % baseline["engine"]
+            sys.exit(1)
+
+    source = reader_source()
+    results = {}
+    regressions = []
+    try:
+        print "%d runs, %s engine" % (runs, engine)
+        print "%-12s %10s %10s %10s" % ("workload", "median", "p95", "memory"),
+        if baseline is not None:
+            print "  %8s %8s" % ("time", "memory"),
+        print
+        for name in names:
+            # The first run makes the image of the core if it needs to be
+            # made, and is not counted
+            run(name, source)
+            samples = [run(name, source) for i in range(runs)]
+            times = [sample["time"] for sample in samples]
+            result = {"median": median(times), "p95": percentile(times, 95),
+                      "memory": max(sample["memory"] for sample in samples)}
+            results[name] = result
+            print "%-12s %9.3fs %9.3fs %8.1fMB" % (name, result["median"], result["p95"],
+                                                  result["memory"] / 1e6),
+            old = baseline is not None and baseline["workloads"].get(name)
+            if old:
+                slower = change(result["median"], old["median"])
+                bigger = change(result["memory"], old["memory"])
+                print "  %+7.1f%% %+7.1f%%" % (slower * 100, bigger * 100),
+                if slower > threshold or bigger > threshold:
+                    regressions.append(name)
+                    print " regression",
+            print
+    finally:
+        os.remove(source)
+
+    if save is not None:
+        f = open(save, "w")
+        json.dump({"engine": engine, "runs": runs, "python": sys.version.split()[0],
+                   "workloads": results}, f, indent=2, separators=(",", ": "), sort_keys=True)
+        f.write("\n")
+        f.close()
+    if len(regressions):
+        print "Regressions beyond %d%%: %s" % (threshold * 100, " ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
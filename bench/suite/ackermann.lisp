@@ -0,0 +1,14 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; Deep recursion, most of it in tail position, with cond.
+
+(defn ackermann (m n)
+  (cond
+    ((= m 0) (+ n 1))
+    ((= n 0) (ackermann (- m 1) 1))
+    (t (ackermann (- m 1) (ackermann m (- n 1))))))
+
+(dolist (i (range 15))
+  (ackermann 2 30))
@@ -0,0 +1,16 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; Lookups of every key of an alist of 300 string keys, with get, and
+;; building it with assoc.
+
+(def table (reduce (fn (table i) (assoc table (str "key" i) i))
+                   (range 300)
+                   nil))
+
+(def table-keys (keys table))
+
+(dolist (i (range 10))
+  (dolist (key table-keys)
+    (get table key)))
@@ -0,0 +1,12 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; Doubly recursive calls: lambda calls, argument binding and arithmetic.
+
+(defn fib (n)
+  (if (< n 2)
+    n
+    (+ (fib (- n 1)) (fib (- n 2)))))
+
+(fib 20)
@@ -0,0 +1,19 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; Macros expanding to macros: expansions of fresh forms, each evaluated
+;; once, and calls through expansions already made.
+
+(defmacro unless (p & body) `(if ,p nil (do ,@body)))
+
+(defmacro clamp (x low high)
+  `(unless (< ,x ,low) (when (> ,x ,high) ,high)))
+
+(dolist (i (range 500))
+  (eval (list 'clamp i 10 (+ i 5))))
+
+(defn clamped (x) (clamp x 10 100))
+
+(dolist (i (range 10000))
+  (clamped i))
@@ -0,0 +1,10 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; map, filter and reduce over a list of 20000 numbers, made once.
+
+(def numbers (apply list (range 20000)))
+
+(dolist (i (range 4))
+  (reduce + (map (fn (x) (* x 3)) (filter even? numbers))))
@@ -0,0 +1,8 @@
+;; -*- mode: clojure -*-
+;; Copyright 2010 Curtis McEnroe <programble@gmail.com>
+;; Licensed under the GNU GPLv3
+
+;; Building strings with str and format.
+
+(dolist (i (range 10000))
+  (str "record " i ": " (format "%05d %s" i "done") " (" :status ")"))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Vector benchmark: indexes every item of lists, vectors and strings of
+# increasing length with nth, builds vectors with conj and takes subvecs
+# of them, and reports the time per item. Operations that take O(1) time
+# keep the time per item flat as the sizes grow.
+
+import time
+
+from common import lispy
+from ast import *
+import core
+
+workloads = [
+    ("nth list", "(nth xs i)", lambda n: List([Number(i) for i in range(n)] + [[]])),
+    ("nth vector", "(nth xs i)", lambda n: Vector([Number(i) for i in range(n)])),
+    ("nth string", "(nth xs i)", lambda n: String("x" * n)),
+    ("conj vector", "(set! xs (conj xs i))", lambda n: Vector()),
+    ("subvec", "(subvec xs i)", lambda n: Vector([Number(i) for i in range(n)])),
+]
+
+def main():
+    for name, source, make in workloads:
+        print name
+        run = lispy(source, "i")
+        for n in [1000, 2000, 4000]:
+            core.scope["xs"] = make(n)
+            start = time.time()
+            run(Number(i) for i in xrange(n))
+            elapsed = time.time() - start
+            print "  %6d items  %8.3fs  %7.2fus/item" % (n, elapsed, elapsed / n * 1e6)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Compiles forms to trees of Python closures. Each closure takes a frame
+# and returns the value of its form, like evaluate does, but the work of
+# telling what kind of form it is, which special form it uses and where
+# its variables live, is done once when compiling rather than every time
+# it is evaluated.
+#
+# Variables bound by fn and let are lexically addressed: each fn call or
+# let gets a frame, a Python list holding its enclosing frame followed by
+# the values bound in it, and a variable compiles to a (depth, index)
+# slot in the frame chain. Other variables are globals, looked up
+# directly in the global scope of the interpreter compiling them. Uncompiled code called from compiled code
+# (macros, eval, fexpr builtins) gets a Scope over the frame chain.
+
+from scope import Scope, dynamic
+from ast import *
+import core
+import profiler
+
+# The value of a slot that has not been bound yet, such as a later name
+# of a let while its earlier values are evaluated
+unbound = object()
+
+class Context:
+    # The names bound in a frame, by slot, and the context of the
+    # enclosing frame. Only the first `visible` names are bound yet.
+    def __init__(self, names, parent=None, visible=None):
+        self.names = names
+        self.parent = parent
+        if visible is None:
+            visible = len(names)
+        self.visible = visible
+
+def resolve(name, ctx, depth=0):
+    # Find where name is bound: None for a global, or a (depth, index,
+    # fallback) slot. If the slot may not be bound yet, fallback is where
+    # to look instead (True if global).
+    while ctx is not None:
+        names = ctx.names
+        for i in range(ctx.visible - 1, -1, -1):
+            if names[i] == name:
+                return (depth, i + 1, None)
+        if name in names[ctx.visible:]:
+            # Bound later in this frame
+            index = names.index(name, ctx.visible)
+            return (depth, index + 1, resolve(name, ctx.parent, depth + 1) or True)
+        ctx = ctx.parent
+        depth += 1
+    return None
+
+def compile_ref(name, location):
+    if location is None:
+        # Global, in the interpreter compiling it
+        scope = core.interpreter().scope
+        if dynamic(name):
+            # Which may be bound in this thread
+            return lambda frame: scope[name]
+        bindings = scope.bindings
+        def ref(frame):
+            try:
+                return bindings[name]
+            except KeyError:
+                raise NameError("name '%s' is not bound" % name)
+        return ref
+    depth, index, fallback = location
+    if fallback is not None:
+        # The slot may not be bound yet
+        other = compile_ref(name, fallback if fallback is not True else None)
+        def checked(frame):
+            start = frame
+            for i in range(depth):
+                frame = frame[0]
+            value = frame[index]
+            if value is unbound:
+                return other(start)
+            return value
+        return checked
+    if depth == 0:
+        return lambda frame: frame[index]
+    if depth == 1:
+        return lambda frame: frame[0][index]
+    if depth == 2:
+        return lambda frame: frame[0][0][index]
+    def ref(frame):
+        for i in range(depth):
+            frame = frame[0]
+        return frame[index]
+    return ref
+
+def compile_store(name, location):
+    # Returns a function that binds a value and returns the previous one
+    if location is None:
+        return lambda frame, value: core.set_global(name, value)
+    depth, index, fallback = location
+    other = None
+    if fallback is not None:
+        other = compile_store(name, fallback if fallback is not True else None)
+    def store(frame, value):
+        start = frame
+        for i in range(depth):
+            frame = frame[0]
+        ret = frame[index]
+        if ret is unbound:
+            return other(start, value)
+        frame[index] = value
+        return ret
+    return store
+
+class FrameBindings:
+    # The bindings of a compiled frame, in the shape of a Scope's dict
+    def __init__(self, frame, names):
+        self.frame = frame
+        self.names = names
+
+    def index(self, key):
+        for i in range(len(self.names) - 1, -1, -1):
+            if self.names[i] == key and self.frame[i + 1] is not unbound:
+                return i + 1
+        return None
+
+    def has_key(self, key):
+        return self.index(key) is not None
+
+    def get(self, key, default=None):
+        i = self.index(key)
+        if i is None:
+            return default
+        return self.frame[i]
+
+    def __getitem__(self, key):
+        i = self.index(key)
+        if i is None:
+            raise KeyError(key)
+        return self.frame[i]
+
+    def keys(self):
+        return [name for i, name in enumerate(self.names) if self.frame[i + 1] is not unbound]
+
+    def __setitem__(self, key, value):
+        if key not in self.names:
+            raise NameError("cannot bind '%s' in a compiled frame" % key)
+        self.frame[self.names.index(key) + 1] = value
+
+    def __delitem__(self, key):
+        raise NameError("cannot unbind '%s' in a compiled frame" % key)
+
+    def __repr__(self):
+        return repr(dict((name, self[name]) for name in self.names if self.has_key(name)))
+
+def frame_scope(frame, ctx):
+    # A Scope over a frame and the frames enclosing it
+    if ctx is None:
+        return core.interpreter().scope
+    scope = Scope(frame_scope(frame[0], ctx.parent))
+    scope.bindings = FrameBindings(frame, ctx.names)
+    return scope
+
+def evaluate(form):
+    # Evaluate a top-level form
+    return compile(form)(None)
+
+def compile(form, ctx=None, tail=False):
+    # In tail position, calls to lambdas are returned as TailCalls
+    if form.__class__ == Symbol:
+        return compile_ref(form.data, resolve(form.data, ctx))
+    if form.__class__ in collections:
+        return compile_collection(form, ctx)
+    # Atoms, strings and the empty list evaluate to themselves
+    if form.__class__ != List or form.tail is None:
+        return lambda frame: form
+    # Improper list
+    if form.tail.__class__ != List:
+        return lambda frame: form.evaluate(frame_scope(frame, ctx))
+    op = form.head
+    args = list(form.tail)
+    # Special forms, unless their symbol is bound locally
+    if op.__class__ == Symbol and resolve(op.data, ctx) is None:
+        builder = builders.get(core.interpreter().scope.bindings.get(op.data))
+        if builder is not None:
+            try:
+                return builder(args, ctx, tail)
+            except (IndexError, ValueError, TypeError, AttributeError, SyntaxError):
+                # Malformed special form, leave it to the builtin to
+                # raise the error when it is evaluated
+                pass
+    return compile_call(op, args, ctx, tail)
+
+def compile_call(op, args, ctx, tail):
+    function = compile(op, ctx)
+    # Arguments are compiled when first evaluated, as the arguments of
+    # macros and fexprs are not always code
+    compiled = [None]
+    def arguments():
+        if compiled[0] is None:
+            compiled[0] = [compile(x, ctx) for x in args]
+        return compiled[0]
+    # The macro last called here and its compiled expansion, as one pair
+    # that threads replace whole, so that they never see one's expansion
+    # with another's macro
+    expansion = [None]
+    # Builtins that only look up streams in their scope can look them up
+    # globally, which is cheaper than making the scope of the frame,
+    # unless they are bound here
+    streams_global = resolve("*in*", ctx) is None and resolve("*out*", ctx) is None
+    scope = core.interpreter().scope
+    def call(frame):
+        f = function(frame)
+        if f.__class__ == Lambda:
+            values = [code(frame) for code in compiled[0] or arguments()]
+            if f.code is not None:
+                if tail:
+                    return TailCall(f.invoke, None, values)
+                # Calls are recorded by Lambda.invoke while profiling
+                if Lambda.traced:
+                    return trampoline(f.invoke(None, *values))
+                return trampoline(f.code(f, values))
+            # A lambda made by uncompiled code
+            result = f.invoke(frame_scope(frame, ctx), *values)
+        elif f.__class__ == Macro:
+            cached = expansion[0]
+            if cached is not None and cached[0] is f:
+                Macro.cache_hits += 1
+            else:
+                cached = (f, compile(f.expand(frame_scope(frame, ctx), *args), ctx, tail))
+                expansion[0] = cached
+            return cached[1](frame)
+        elif f in fexprs:
+            result = f(frame_scope(frame, ctx), *args)
+        elif f in scoped:
+            if streams_global and f in streams:
+                local = scope
+            else:
+                local = frame_scope(frame, ctx)
+            result = f(local, *[wrap(code(frame)) for code in compiled[0] or arguments()])
+        else:
+            result = f(scope, *[wrap(code(frame)) for code in compiled[0] or arguments()])
+        if tail:
+            return result
+        return trampoline(result)
+    return call
+
+collections = set([Map, Set, Vector])
+
+def compile_collection(form, ctx):
+    # Maps, sets and vectors evaluate their items, keys and values, unless
+    # they all evaluate to themselves
+    if form.__class__ == Map:
+        items = [x for entry in form.entries() for x in entry]
+    else:
+        items = list(form)
+    if all(x.__class__ in self_evaluating for x in items):
+        return lambda frame: form
+    codes = [compile(x, ctx) for x in items]
+    if form.__class__ == Map:
+        def collection(frame):
+            values = [code(frame) for code in codes]
+            return Map(zip(values[0::2], values[1::2]))
+    else:
+        cls = form.__class__
+        def collection(frame):
+            return cls([code(frame) for code in codes])
+    return collection
+
+def compile_body(exprs, ctx, tail):
+    # Expressions evaluated in order, the last giving the value
+    codes = [compile(x, ctx) for x in exprs[:-1]]
+    last = compile(exprs[-1], ctx, tail)
+    if not len(codes):
+        return last
+    def body(frame):
+        for code in codes:
+            code(frame)
+        return last(frame)
+    return body
+
+# Special forms
+
+def compile_quote(args, ctx, tail):
+    x, = args
+    return lambda frame: x
+
+def compile_cond(args, ctx, tail):
+    clauses = []
+    for clause in args:
+        exprs = list(clause)
+        if len(exprs) > 1:
+            body = compile_body(exprs[1:], ctx, tail)
+        else:
+            body = None
+        clauses.append((compile(exprs[0], ctx), body))
+    def cond(frame):
+        for test, body in clauses:
+            value = test(frame)
+            # Anything but nil, or an empty lazy sequence, is true
+            if value.__class__ == List:
+                if value.tail is None:
+                    continue
+            elif value.__class__ == LazySeq and value.empty():
+                continue
+            if body is None:
+                return value
+            return body(frame)
+        return core.nil
+    return cond
+
+def compile_do(args, ctx, tail):
+    return compile_body(args, ctx, tail)
+
+def compile_let(args, ctx, tail):
+    pairs = list(args[0])
+    names = [pair.car().data for pair in pairs]
+    # Each value sees the names bound before it
+    slots = [(i + 1, compile(pair.cdr().car(), Context(names, ctx, i))) for i, pair in enumerate(pairs)]
+    body = compile_body(args[1:], Context(names, ctx), tail)
+    size = len(names)
+    def let(frame):
+        local = [frame] + [unbound] * size
+        for i, code in slots:
+            local[i] = code(local)
+        return body(local)
+    return let
+
+def compile_with_open(args, ctx, tail):
+    # Like let, closing the streams bound when the body is left. The body
+    # is not in tail position, as its calls must be made before then.
+    pairs = list(args[0])
+    names = [pair.car().data for pair in pairs]
+    slots = [(i + 1, compile(pair.cdr().car(), Context(names, ctx, i))) for i, pair in enumerate(pairs)]
+    body = compile_body(args[1:], Context(names, ctx), False)
+    size = len(names)
+    def with_open(frame):
+        local = [frame] + [unbound] * size
+        streams = []
+        try:
+            for i, code in slots:
+                local[i] = code(local)
+                streams.append(local[i])
+            return body(local)
+        finally:
+            for stream in reversed(streams):
+                stream.close()
+    return with_open
+
+def compile_binding(args, ctx, tail):
+    # The body is not in tail position, as its calls must be made while
+    # the vars are bound
+    pairs = list(args[0])
+    names = [pair.car().data for pair in pairs]
+    codes = [compile(pair.cdr().car(), ctx) for pair in pairs]
+    body = compile_body(args[1:], ctx, False)
+    def binding(frame):
+        outer = core.bind_dynamic(names, [code(frame) for code in codes])
+        try:
+            return body(frame)
+        finally:
+            core.unbind_dynamic(outer)
+    return binding
+
+def compile_future(args, ctx, tail):
+    body = compile_body(args, ctx, False)
+    return lambda frame: core.spawn(lambda: body(frame))
+
+def compile_profile(args, ctx, tail):
+    body = compile_body(args, ctx, False)
+    return lambda frame: profiler.profile_thunk(lambda: body(frame))
+
+def compile_fn(args, ctx, tail):
+    names = args[0]
+    body = tuple(args[1:])
+    if core.expand_bodies:
+        names, body = core.expanded_lambda(core.interpreter().scope, names, body, context_names(ctx))
+    enter = compile_enter(names, body, ctx)
+    def fn(frame):
+        l = Lambda(None, names, body)
+        l.frame = frame
+        l.code = enter
+        return l
+    return fn
+
+def context_names(ctx):
+    # The names bound in a context and those enclosing it
+    names = set()
+    while ctx is not None:
+        names.update(ctx.names)
+        ctx = ctx.parent
+    return names
+
+def compile_enter(names, body, ctx):
+    # Returns a function that binds the arguments of a call to a lambda in
+    # a new frame and evaluates its body in it
+    plan = Bindings.of(names)
+    # Slot 1 holds the lambda itself, bound to recur
+    slots = ["recur"] + plan.names
+    required = len(plan.required)
+    # Slots and compiled default values of optional arguments, where
+    # each default value sees the arguments before it
+    optional = []
+    for i, (name, default) in enumerate(plan.optional):
+        slot = required + i + 2
+        if default is not None:
+            default = compile(default, Context(slots, ctx, slot - 1))
+        optional.append((slot, default))
+    code = compile_body(body, Context(slots, ctx), True)
+    if not len(optional) and plan.rest is None:
+        # Only required arguments
+        def enter(l, args):
+            if len(args) != required:
+                plan.check(len(args))
+            frame = [l.frame, l]
+            frame.extend(args)
+            return code(frame)
+    else:
+        size = len(plan.names)
+        def enter(l, args):
+            plan.check(len(args))
+            frame = [l.frame, l]
+            frame.extend(args[:required])
+            frame.extend([unbound] * (size - required))
+            i = required
+            for slot, default in optional:
+                if i < len(args):
+                    frame[slot] = args[i]
+                    i += 1
+                elif default is not None:
+                    frame[slot] = default(frame)
+                else:
+                    frame[slot] = core.nil
+            if plan.rest is not None:
+                frame[-1] = List(list(args[i:]) + [[]])
+            return code(frame)
+    enter.ctx = ctx
+    return enter
+
+def recompile(l, ctx):
+    # Give a lambda whose code was lost, such as one loaded from an image,
+    # code that compiles its body again the first time it is called
+    def enter(l, args):
+        l.code = compile_enter(l.bindings, l.body, ctx)
+        return l.code(l, args)
+    enter.ctx = ctx
+    l.code = enter
+
+def compile_def(args, ctx, tail):
+    symbol, value = args
+    code = compile(value, ctx)
+    def def_(frame):
+        # Can only bind an unbound symbol, or a native builtin while the
+        # core is being loaded
+        if symbol.__class__ != Symbol:
+            return core.nil
+        if not core.definable(symbol.data):
+            return core.nil
+        value = code(frame)
+        # Unless another thread has bound it since
+        with core.lock:
+            if not core.definable(symbol.data):
+                return core.nil
+            core.interpreter().scope[symbol.data] = value
+        core.name(value, symbol.data)
+        return symbol
+    return def_
+
+def compile_set(args, ctx, tail):
+    symbol, value = args
+    if symbol.__class__ != Symbol:
+        return lambda frame: core.nil
+    code = compile(value, ctx)
+    store = compile_store(symbol.data, resolve(symbol.data, ctx))
+    return lambda frame: store(frame, code(frame))
+
+# Special forms from core.py compiled to dedicated closures
+builders = {
+    core.quote: compile_quote,
+    core.cond: compile_cond,
+    core.do: compile_do,
+    core.let: compile_let,
+    core.with_open: compile_with_open,
+    core.binding: compile_binding,
+    core.future: compile_future,
+    profiler.profile: compile_profile,
+    core.fn: compile_fn,
+    core.def_: compile_def,
+    core.set: compile_set,
+}
+
+# Builtins that are passed their arguments unevaluated
+fexprs = set(builders.keys() + [
+    core.undef,
+    core.unset,
+    core.syntax_quote,
+    core.macro,
+    core.macroexpand,
+    core.macroexpand_all,
+])
+
+# Builtins that use the scope they are called in
+scoped = set([
+    core.eval,
+    core.apply,
+    core.print_,
+    core.read_line,
+    core.line_seq,
+    core.flush,
+])
+
+# Scoped builtins that use their scope only to look up *in* or *out*
+streams = set([
+    core.print_,
+    core.read_line,
+    core.line_seq,
+    core.flush,
+])
@@ -40,33 +40,12 @@
 (defmacro if (p x y) `(cond (,p ,x) (t ,y)))
 (defmacro when (p & b) `(if ,p (do ,@b) nil))
 
-;; Apply
-(defmacro apply (f l) `(,f ,@(eval l)))
-
 ;; Identity (does nothing, woot woot)
 (defn identity (x) x)
 
-;; Reduce
-(defn reduce (f xs ? (x :not-supplied))
-  (if (= x :not-supplied)
-    (reduce f (cdr xs) (car xs))
-    (if (nil? (cdr xs))
-      (f x (car xs))
-      (reduce f (cdr xs) (f x (car xs))))))
-
-;; Filter
-(defn filter (p xs)
-  (if (nil? xs)
-    xs
-    (if (p (car xs))
-      (cons (car xs) (filter p (cdr xs)))
-      (filter p (cdr xs)))))
-
-;; Map
-(defn map (f xs)
-  (if (nil? xs)
-    xs
-    (cons (f (car xs)) (map f (cdr xs)))))
+;; map, filter, reduce, count, nth, last, append, concat, reverse,
+;; range, contains?, take, take-while, drop, iterate and str-to-list are
+;; builtins. Defining them here replaces the builtins.
 
 ;; Alter!
 (defmacro alter! (name func & args)
@@ -136,50 +115,6 @@
 (defn list (& args)
   args)
 
-(defn contains? (xs key)
-  (if (nil? xs)
-    nil
-    (if (= (car xs) key)
-      t
-      (contains? (cdr xs) key))))
-
-(defn count (xs)
-  (reduce (fn (acc _) (inc acc)) xs 0))
-
-(defn nth (xs i)
-  (if (zero? i)
-    (car xs)
-    (nth (cdr xs) (dec i))))
-
-(defn last (xs)
-  (if (nil? (cdr xs))
-    (car xs)
-    (last (cdr xs))))
-
-(defn append (xs y)
-  (if (nil? xs)
-    (cons y nil)
-    (cons (car xs) (append (cdr xs) y))))
-
-(defn concat (xs ys)
-  (if (nil? xs)
-    ys
-    (cons (car xs) (concat (cdr xs) ys))))
-
-(defn take (n xs)
-  (if (zero? n)
-    nil
-    (cons (car xs) (take (dec n) (cdr xs)))))
-
-(defn take-while (p xs)
-  (when (p (car xs))
-    (cons (car xs) (take-while p (cdr xs)))))
-
-(defn drop (n xs)
-  (if (zero? n)
-    xs
-    (drop (dec n) (cdr xs))))
-
 (defn drop-while (p xs)
   (if (p (car xs))
     (drop-while p (cdr xs))
@@ -190,9 +125,6 @@
     nil
     (cons x (repeat (dec n) x))))
 
-(defn reverse (xs)
-  (reduce (fn (acc x) (cons x acc)) xs nil))
-
 (defn zip (xs ys)
   (if (or (nil? xs) (nil? ys))
     nil
@@ -213,6 +145,9 @@
 (defmacro for (binding body) 
   `(map (fn (,(car binding)) ,body) ,(cadr binding)))
 
+(defmacro pfor (binding body)
+  `(pmap (fn (,(car binding)) ,body) ,(cadr binding)))
+
 (defn interpose (x xs)
   (if (nil? (cdr xs))
     xs
@@ -227,39 +162,8 @@
 (defn improper? (xs)
   (not (proper? xs)))
 
-(defn range (min ? max)
-  (if (nil? max)
-    (range 0 min)
-    (if (= min max)
-      nil
-      (cons min (range (inc min) max)))))
-
-;; Association list related functions
-(defn keys (alist)
-  (map car alist))
-
-(defn vals (alist)
-  (map cdr alist))
-
-(defn get (alist key ? not-found)
-  (if (nil? alist)
-    not-found
-    (if (= (caar alist) key)
-      (cdr (car alist))
-      (get (cdr alist) key not-found))))
-
-(defn assoc (alist key val)
-    (cons (cons key val) (dissoc alist key)))
-
-(defn dissoc (alist key)
-  (filter (fn (x) (not= (car x) key)) alist))
-
-;; String related functions
-
-(defn str-to-list (str)
-  (if (= str "")
-    nil
-    (cons (car str) (str-to-list (cdr str)))))
+;; keys, vals, get, assoc and dissoc are builtins, which work on alists
+;; and maps. Defining them here replaces the builtins.
 
 ;; Functions that make functions
 
@@ -2,12 +2,60 @@
 # Licensed under the GNU GPLv3
 
 import sys
+import math
+import itertools
+import mmap
+import atexit
+import weakref
+import threading
 
-from scope import Scope
+from scope import Scope, GlobalScope, dynamic
 from ast import *
 
-# The global scope
-scope = Scope()
+# The global scope of the first interpreter, in which the builtins are
+# bound as they are defined
+scope = GlobalScope()
+
+# Held while changing global bindings, which threads can do at once
+lock = threading.RLock()
+
+# Interpreters
+#
+# An interpreter is a global scope of its own, in which a core is loaded
+# and a program makes its globals. Several can run in one process without
+# seeing each other's globals, on threads of their own or in turns on the
+# same ones. A thread evaluates in the interpreter it has entered with
+# `with`, or else in `main`, the first one, whose global scope is `scope`.
+# The state of the Python modules, such as the options set by lispy.py
+# and the workers of pmap, is shared by every interpreter.
+
+class Interpreter:
+    def __init__(self, scope):
+        self.scope = scope
+        # Whether the core is being loaded (see load_lisp_core in lispy.py)
+        self.loading_core = False
+
+    def __enter__(self):
+        entered.outer.append(entered.interpreter)
+        entered.interpreter = self
+        return self
+
+    def __exit__(self, *exc_info):
+        entered.interpreter = entered.outer.pop()
+
+main = Interpreter(scope)
+
+class Entered(threading.local):
+    # The interpreter a thread is in, and those it was in before
+    def __init__(self):
+        self.interpreter = main
+        self.outer = []
+
+entered = Entered()
+
+def interpreter():
+    # The interpreter this thread is in
+    return entered.interpreter
 
 # Core bindings
 
@@ -54,23 +102,20 @@ def cdr(scope, x):
 scope["cdr"] = cdr
 
 def cons(scope, x, y):
-    x, y = x.evaluate(scope), y.evaluate(scope)
-    if y == nil:
-        return List([x, []])
-    elif y.__class__ == List:
-        return List([x] + y.data)
-    else:
-        return List([x, y])
+    return List.cons(x.evaluate(scope), y.evaluate(scope))
 scope["cons"] = cons
 
 def cond(scope, *x):
     for clause in x:
-        if clause.cdr() == nil and not clause.car().evaluate(scope) == nil:
-            return clause.car().evaluate(scope)
-        if not clause.car().evaluate(scope) == nil:
-            for expr in clause.cdr().data[:-2]:
+        test = clause.car().evaluate(scope)
+        if not test == nil:
+            # A clause with no body evaluates to its test
+            body = list(clause.cdr())
+            if not len(body):
+                return test
+            for expr in body[:-1]:
                 expr.evaluate(scope)
-            return clause.cdr().data[-2].evaluate(scope)
+            return body[-1].evaluate_tail(scope)
     return nil
 scope["cond"] = cond
 
@@ -81,22 +126,39 @@ def def_(local, symbol, value):
     if symbol.__class__ != Symbol:
         return nil
     # Cannot bind already bound symbol
-    if scope.has_key(symbol.data):
+    if not definable(symbol.data):
         return nil
     # Evaluate value
     value = value.evaluate(local)
-    # Set metadata name
-    #value.meta["name"] = symbol.data
-    # Bind in global scope
-    scope[symbol.data] = value
+    # Bind in global scope, unless another thread has since
+    with lock:
+        if not definable(symbol.data):
+            return nil
+        interpreter().scope[symbol.data] = value
+    name(value, symbol.data)
     return symbol
 scope["def"] = def_
 
+def definable(name):
+    # Whether def can bind name: an unbound name, or while the core is
+    # being loaded, a name still bound to a native builtin
+    current = interpreter()
+    if not current.scope.has_key(name):
+        return True
+    return current.loading_core and current.scope.bindings[name] is natives.get(name)
+
+def name(value, name):
+    # Lambdas and macros are named after the first symbol they are bound to
+    if isinstance(value, Lambda) and value.name is None:
+        value.name = name
+
 def undef(local, symbol):
-    if scope.has_key(symbol.data):
-        value = scope[symbol.data]
-        del(scope[symbol.data])
-        return value
+    scope = interpreter().scope
+    with lock:
+        if scope.has_key(symbol.data):
+            value = scope.bindings[symbol.data]
+            del(scope[symbol.data])
+            return value
     return nil
 scope["undef!"] = undef
 
@@ -104,19 +166,34 @@ def set(scope, symbol, value):
     # Can only bind to a symbol
     if symbol.__class__ != Symbol:
         return nil
-    if scope.has_key(symbol.data):
-        ret = scope[symbol.data]
-    elif scope.parent:
-        return set(scope.parent, symbol, value)
-    else:
-        ret = nil
     value = value.evaluate(scope)
+    # Rebind in the scope it is bound in, or globally if it is not bound
+    while not scope.has_key(symbol.data) and scope.parent:
+        scope = scope.parent
+    if scope.__class__ == GlobalScope:
+        return set_global(symbol.data, value)
+    ret = scope[symbol.data]
     scope[symbol.data] = value
     return ret
 scope["set!"] = set
 
+def set_global(name, value):
+    # Set a global binding, or the binding of a dynamic var in this
+    # thread, and return the previous value
+    scope = interpreter().scope
+    if dynamic(name):
+        ret = scope.rebind(name, value)
+        if ret is not None:
+            return ret
+    with lock:
+        ret = scope.bindings.get(name, nil)
+        scope[name] = value
+    return ret
+
 def unset(scope, symbol):
     if scope.has_key(symbol.data):
+        if scope.__class__ == GlobalScope:
+            return undef(scope, symbol)
         value = scope[symbol.data]
         del(scope[symbol.data])
         return value
@@ -125,59 +202,107 @@ def unset(scope, symbol):
     return nil
 scope["unset!"] = unset
 
+# Whether fn expands every macro call in the body of a lambda when it
+# makes it (see --expand-macros in lispy.py)
+expand_bodies = False
+
+def expand_macros(scope):
+    # Whether lambdas are made with their macro calls expanded
+    if expand_bodies:
+        return t
+    return nil
+scope["expand-macros?"] = expand_macros
+
 def fn(scope, names, *body):
-    l = Lambda(scope, names, body)
-    l.meta = names.meta
-    return l
+    if expand_bodies:
+        names, body = expanded_lambda(scope, names, body, local_names(scope))
+    return Lambda(scope, names, body)
 scope["fn"] = fn
 
 # Macro functions
 
+# Symbols are interned, so the one symbol of each name can be kept
+unquote = Symbol("unquote")
+unquote_splice = Symbol("unquote-splice")
+
 def syntax_quote(scope, expr):
-    if expr.__class__ != List:
+    if expr.__class__ != List or expr == nil:
         return expr
-    new = []
-    for x in expr.data:
-        if x.__class__ == List:
-            # Evaluate only unquoted items
-            if x.car() == Symbol("unquote"):
-                new.append(x.cdr().car().evaluate(scope))
-            elif x.car() == Symbol("unquote-splice"):
-                l = x.cdr().car().evaluate(scope)
-                for i in l.data[:-1]:
-                    new.append(i)
-            else:
-                new.append(syntax_quote(scope, x))
+    x = expr.car()
+    if x.__class__ == List:
+        # Evaluate only unquoted items
+        if x.car() is unquote:
+            return List.cons(x.cdr().car().evaluate(scope), syntax_quote(scope, expr.cdr()))
+        elif x.car() is unquote_splice:
+            items = list(x.cdr().car().evaluate(scope))
+            rest = syntax_quote(scope, expr.cdr())
+            for i in reversed(items):
+                rest = List.cons(i, rest)
+            return rest
         else:
-            new.append(x)
-    return List(new)
+            x = syntax_quote(scope, x)
+    return List.cons(x, syntax_quote(scope, expr.cdr()))
 scope["syntax-quote"] = syntax_quote
 
 def macro(scope, names, *body):
-    m = Macro(scope, names, body)
-    m.meta = names.meta
-    return m
+    return Macro(scope, names, body)
 scope["macro"] = macro
 
 # Other core functions
 
 def let(scope, bindings, *exprs):
     local = Scope(scope)
-    for pair in bindings.data[:-1]:
+    for pair in bindings:
         local[pair.car().data] = pair.cdr().car().evaluate(local)
         # Set metadata name
         #local[pair.car().data].meta["name"] = pair.car().data
     for expr in exprs[:-1]:
         expr.evaluate(local)
-    return exprs[-1].evaluate(local)
+    return exprs[-1].evaluate_tail(local)
 scope["let"] = let
 
 def do(scope, *exprs):
     for expr in exprs[:-1]:
         expr.evaluate(scope)
-    return exprs[-1].evaluate(scope)
+    return exprs[-1].evaluate_tail(scope)
 scope["do"] = do
 
+def bind_dynamic(names, values):
+    # Bind dynamic vars in this thread, on top of those already bound in
+    # it, and return the bindings to restore afterwards
+    scope = interpreter().scope
+    bindings = {}
+    for name, value in zip(names, values):
+        if not dynamic(name):
+            raise NameError("name '%s' is not of a dynamic var, like *%s*" % (name, name))
+        if not scope.has_key(name):
+            raise NameError("name '%s' is not bound" % name)
+        bindings[name] = value
+    outer = scope.threads.bindings
+    if outer is not None:
+        bindings = dict(outer.items() + bindings.items())
+    scope.threads.bindings = bindings
+    return outer
+
+def unbind_dynamic(outer):
+    # Restore the dynamic vars bind_dynamic bound
+    interpreter().scope.threads.bindings = outer
+
+def binding(local, bindings, *exprs):
+    # Like let, but for dynamic vars, which are rebound for this thread
+    # only, and seen by everything the body calls
+    bindings = list(bindings)
+    values = [pair.cdr().car().evaluate(local) for pair in bindings]
+    outer = bind_dynamic([pair.car().data for pair in bindings], values)
+    try:
+        for expr in exprs[:-1]:
+            expr.evaluate(local)
+        # Not a tail call, which would be made after the vars are restored
+        return exprs[-1].evaluate(local)
+    finally:
+        unbind_dynamic(outer)
+scope["binding"] = binding
+
 # Arithmetic functions
 
 def add(scope, *x):
@@ -247,15 +372,489 @@ scope[">"] = gt
 def macroexpand(scope, x):
     while x.car().evaluate(scope).__class__ == Macro:
         m = x.car().evaluate(scope)
-        x = Lambda(m.scope, m.bindings, m.body)(scope, *[List([Symbol("quote"), i, []]) for i in x.cdr().data[:-1]])
+        x = trampoline(Lambda(m.scope, m.bindings, m.body)(scope, *[List([Symbol("quote"), i, []]) for i in x.cdr()]))
     return x
 scope["macroexpand"] = macroexpand
 
+def macroexpand_all(local, x):
+    return expand_all(local, x, local_names(local))
+scope["macroexpand-all"] = macroexpand_all
+
+def local_names(scope):
+    # The names bound in the scopes between scope and the global scope
+    names = []
+    while scope is not None and scope.__class__ != GlobalScope:
+        names.extend(scope.bindings.keys())
+        scope = scope.parent
+    return frozenset(names)
+
+def expand_all(local, x, bound):
+    # x with every macro call in it expanded, other than in quoted forms.
+    # Macros are looked up globally, and names in bound are of local
+    # variables, which shadow them.
+    expand = lambda y: expand_all(local, y, bound)
+    if x.__class__ == Vector or x.__class__ == Set or x.__class__ == Map:
+        return expand_literal(x, expand)
+    scope = interpreter().scope
+    while proper(x) and x.tail is not None:
+        if x.head.__class__ != Symbol or x.head.data in bound:
+            break
+        f = scope.bindings.get(x.head.data)
+        if f.__class__ == Macro:
+            x = f.expand(local, *x.tail)
+            continue
+        if f is quote or f is macroexpand or f is macroexpand_all:
+            # Their arguments are not code, or not yet
+            return x
+        if f is syntax_quote:
+            # Only the forms it unquotes are code
+            return map_items(lambda y: expand_template(local, y, bound), x, 1)
+        if f is fn or f is macro:
+            names = x.tail.head
+            if names.__class__ != List:
+                return x
+            bound = bound.union(Bindings.of(names).names)
+            expanded = expand_lambda_list(local, names, bound)
+            body = map_items(lambda y: expand_all(local, y, bound), x, 2)
+            if expanded is names:
+                return body
+            return copy_position(List.cons(x.head, List.cons(expanded, body.tail.tail)), x)
+        if f is let or f is binding or f is with_open:
+            pairs = x.tail.head
+            if not proper(pairs):
+                return x
+            bound = bound.union(pair.car().data for pair in pairs if pair.car().__class__ == Symbol)
+            expand = lambda y: expand_all(local, y, bound)
+            # The value of each binding, and the body
+            expanded = map_items(lambda pair: map_items(expand, pair, 1), pairs)
+            body = map_items(expand, x, 2)
+            if expanded is pairs:
+                return body
+            return copy_position(List.cons(x.head, List.cons(expanded, body.tail.tail)), x)
+        if f is cond:
+            return map_items(lambda clause: map_items(expand, clause), x, 1)
+        break
+    return map_items(expand, x)
+
+def expand_literal(x, expand):
+    # A vector, set or map with expand applied to its items, or to its
+    # keys and values, which they evaluate
+    if x.__class__ == Map:
+        entries = list(x.entries())
+        expanded = [(expand(key), expand(value)) for key, value in entries]
+        for (key, value), (k, v) in zip(entries, expanded):
+            if key is not k or value is not v:
+                return copy_position(Map(expanded), x)
+        return x
+    items = list(x)
+    expanded = [expand(y) for y in items]
+    for y, z in zip(items, expanded):
+        if y is not z:
+            return copy_position(x.__class__(expanded), x)
+    return x
+
+def expand_lambda_list(local, names, bound):
+    # A lambda list with the macro calls in the default values of its
+    # optional arguments expanded. Every argument counts as bound, which
+    # at worst leaves a macro call an argument after it shadows to be
+    # expanded when evaluated.
+    def item(y):
+        if y.__class__ != List:
+            return y
+        return map_items(lambda z: expand_all(local, z, bound), y, 1)
+    return map_items(item, names)
+
+def expand_template(local, x, bound):
+    # A syntax-quoted form with the macro calls in the forms it unquotes
+    # expanded, which are those syntax_quote evaluates
+    def item(y):
+        if y.__class__ != List or y.tail is None or y.tail.__class__ != List:
+            return y
+        if y.head is unquote or y.head is unquote_splice:
+            z = expand_all(local, y.tail.head, bound)
+            if z is y.tail.head:
+                return y
+            return copy_position(List.cons(y.head, List.cons(z, y.tail.tail)), y)
+        return expand_template(local, y, bound)
+    return map_items(item, x)
+
+def proper(x):
+    # Whether x is a proper list
+    while x.__class__ == List:
+        if x.tail is None:
+            return True
+        x = x.tail
+    return False
+
+def map_items(f, x, start=0):
+    # x with f applied to its items from start on, if it is a proper list.
+    # It is only copied if an item changed.
+    if not proper(x):
+        return x
+    items = list(x)
+    mapped = items[:start] + [f(y) for y in items[start:]]
+    for y, z in zip(items, mapped):
+        if y is not z:
+            return copy_position(List(mapped + [[]]), x)
+    return x
+
+def copy_position(y, x):
+    position = getattr(x, "position", None)
+    if position is not None:
+        y.position = position
+    return y
+
+def expanded_lambda(local, names, body, bound):
+    # The lambda list and body of a fn form with their macro calls
+    # expanded, once for each form, kept with the analysis of its lambda
+    # list
+    plan = Bindings.of(names)
+    cached = getattr(plan, "expanded", None)
+    if cached is not None and len(cached[0]) == len(body) and \
+       all(x is y for x, y in zip(cached[0], body)):
+        return cached[1]
+    bound = bound.union(plan.names)
+    expanded = (expand_lambda_list(local, names, bound),
+                tuple(expand_all(local, x, bound) for x in body))
+    plan.expanded = (body, expanded)
+    return expanded
+
+def macro_stats(scope):
+    return List([List([Keyword("expansions"), Number(Macro.expansions)]),
+                 List([Keyword("cache-hits"), Number(Macro.cache_hits)]),
+                 []])
+scope["macro-stats"] = macro_stats
+
+def apply(scope, f, l):
+    # Call f with the items of l as its arguments
+    return f.evaluate(scope)(scope, *l.evaluate(scope))
+scope["apply"] = apply
+
+# Sequence functions
+#
+# These used to be defined in core.lisp, and are builtins for speed. They
+# are listed in `natives`, and def can rebind them while the core is
+# loaded, so a core can still define its own.
+
+def call(scope, f, *args):
+    # Call f with arguments that are already evaluated
+    if f.__class__ == Lambda:
+        return trampoline(f.invoke(scope, *args))
+    return trampoline(f(scope, *[wrap(x) for x in args]))
+
+def evaluate_once(scope, x):
+    # Evaluate an argument that is only evaluated once. An evaluated
+    # argument lets go of its value, so that the arguments of the call do
+    # not keep the head of a lazy sequence while it is walked.
+    if x.__class__ == Value:
+        value = x.data
+        x.data = nil
+        return value
+    return x.evaluate(scope)
+
+def truthy(x):
+    # Anything but nil, or an empty lazy sequence, is true
+    if x.__class__ == LazySeq:
+        return not x.empty()
+    return x.__class__ != List or x.tail is not None
+
+def map_(scope, f, xs):
+    f, xs = f.evaluate(scope), xs.evaluate(scope)
+    # Lazy over a lazy sequence
+    if xs.__class__ == LazySeq:
+        return LazySeq(lambda: (call(scope, f, x) for x in xs))
+    if xs == nil:
+        return xs
+    return List([call(scope, f, x) for x in xs] + [[]])
+scope["map"] = map_
+
+def filter_(scope, p, xs):
+    p, xs = p.evaluate(scope), xs.evaluate(scope)
+    if xs.__class__ == LazySeq:
+        return LazySeq(lambda: (x for x in xs if truthy(call(scope, p, x))))
+    if xs == nil:
+        return xs
+    return List([x for x in xs if truthy(call(scope, p, x))] + [[]])
+scope["filter"] = filter_
+
+def reduce_(scope, f, xs, *x):
+    f = f.evaluate(scope)
+    # Items are taken one at a time, and the head of a lazy sequence is
+    # not kept
+    items = iter(evaluate_once(scope, xs))
+    acc = None
+    if len(x):
+        acc = x[0].evaluate(scope)
+        if acc == Keyword("not-supplied"):
+            acc = None
+    if acc is None:
+        acc = next(items, nil)
+    called = False
+    for item in items:
+        acc = call(scope, f, acc, item)
+        called = True
+    # With no items left, f is still called once, with nil
+    if not called:
+        acc = call(scope, f, acc, nil)
+    return acc
+scope["reduce"] = reduce_
+
+def count(scope, xs):
+    xs = evaluate_once(scope, xs)
+    if xs.__class__ == Map or xs.__class__ == Set:
+        return Number(xs.count)
+    elif xs.__class__ == Vector:
+        return Number(xs.count())
+    elif xs.__class__ == String:
+        return Number(len(xs.data))
+    items = iter(xs)
+    del xs
+    n = 0
+    for x in items:
+        n += 1
+    return Number(n)
+scope["count"] = count
+
+def nth(scope, xs, i):
+    xs, i = evaluate_once(scope, xs), i.evaluate(scope)
+    if i.data < 0:
+        return nil
+    # Vectors and strings are indexed directly
+    if xs.__class__ == Vector:
+        return xs.nth(i.data, nil)
+    elif xs.__class__ == String:
+        if 0 <= i.data < len(xs.data):
+            return Character(xs.data[i.data])
+        return nil
+    elif xs.__class__ == LazySeq:
+        items = iter(xs)
+        del xs
+        return next(itertools.islice(items, i.data, None), nil)
+    for n in xrange(i.data):
+        xs = xs.cdr()
+    return xs.car()
+scope["nth"] = nth
+
+def last(scope, xs):
+    xs = evaluate_once(scope, xs)
+    if xs.__class__ == Vector:
+        return xs.nth(xs.count() - 1, nil)
+    items = iter(xs)
+    del xs
+    x = nil
+    for x in items:
+        pass
+    return x
+scope["last"] = last
+
+def append(scope, xs, y):
+    return List(list(xs.evaluate(scope)) + [y.evaluate(scope), []])
+scope["append"] = append
+
+def concat(scope, xs, ys):
+    xs, ys = xs.evaluate(scope), ys.evaluate(scope)
+    for x in reversed(list(xs)):
+        ys = List.cons(x, ys)
+    return ys
+scope["concat"] = concat
+
+def reverse(scope, xs):
+    acc = nil
+    for x in xs.evaluate(scope):
+        acc = List.cons(x, acc)
+    return acc
+scope["reverse"] = reverse
+
+def range_(scope, min, *max):
+    # Lazy
+    min = min.evaluate(scope)
+    if not len(max) or max[0].evaluate(scope) == nil:
+        min, max = Number(0), min
+    else:
+        max = max[0].evaluate(scope)
+    # The numbers are max - 1, max - 2 and so on, down to min, as they
+    # may not be integers
+    def numbers():
+        top = max.data - 1
+        if top < min.data:
+            return
+        for i in xrange(int(math.floor(top - min.data)), -1, -1):
+            yield Number(top - i)
+    return LazySeq(numbers)
+scope["range"] = range_
+
+def contains(scope, xs, key):
+    xs, key = evaluate_once(scope, xs), key.evaluate(scope)
+    # Keys of maps, items of sets and lists
+    if xs.__class__ == Map or xs.__class__ == Set:
+        if xs.contains(key):
+            return t
+        return nil
+    items = iter(xs)
+    del xs
+    for x in items:
+        if x == key:
+            return t
+    return nil
+scope["contains?"] = contains
+
+# Lazy sequence functions
+#
+# These make lazy sequences, whatever they are given. map, filter and
+# range are also lazy, given a lazy sequence.
+
+def take(scope, n, xs):
+    n, xs = n.evaluate(scope), xs.evaluate(scope)
+    return LazySeq(lambda: itertools.islice(xs, n.data))
+scope["take"] = take
+
+def take_while(scope, p, xs):
+    p, xs = p.evaluate(scope), xs.evaluate(scope)
+    return LazySeq(lambda: itertools.takewhile(lambda x: truthy(call(scope, p, x)), xs))
+scope["take-while"] = take_while
+
+def drop(scope, n, xs):
+    n, xs = n.evaluate(scope), xs.evaluate(scope)
+    return LazySeq(lambda: itertools.islice(xs, n.data, None))
+scope["drop"] = drop
+
+def iterate(scope, f, x):
+    # x, (f x), (f (f x)) and so on, without end
+    f, x = f.evaluate(scope), x.evaluate(scope)
+    def items():
+        y = x
+        while True:
+            yield y
+            y = call(scope, f, y)
+    return LazySeq(items)
+scope["iterate"] = iterate
+
+# Association functions
+#
+# These work on maps, and on alists, lists of (key . value) pairs, as
+# core.lisp used to. Sets work as maps of each of their items to itself.
+
+def hash_map(scope, *x):
+    x = [i.evaluate(scope) for i in x]
+    if len(x) % 2:
+        raise TypeError("expected a value for each key, got %d arguments" % len(x))
+    return Map(zip(x[0::2], x[1::2]))
+scope["hash-map"] = hash_map
+
+def hash_set(scope, *x):
+    return Set([i.evaluate(scope) for i in x])
+scope["hash-set"] = hash_set
+
+def get(scope, xs, key, *not_found):
+    xs, key = xs.evaluate(scope), key.evaluate(scope)
+    if xs.__class__ == Map or xs.__class__ == Set:
+        value = xs.get(key, missing)
+        if value is not missing:
+            return value
+    elif xs.__class__ == Vector:
+        # Vectors are looked up by index
+        if key.__class__ == Number:
+            value = xs.nth(key.data, missing)
+            if value is not missing:
+                return value
+    else:
+        for pair in xs:
+            if pair.car() == key:
+                return pair.cdr()
+    if len(not_found):
+        return not_found[0].evaluate(scope)
+    return nil
+scope["get"] = get
+
+def assoc(scope, xs, key, value):
+    xs, key, value = xs.evaluate(scope), key.evaluate(scope), value.evaluate(scope)
+    if xs.__class__ == Map:
+        return xs.assoc(key, value)
+    elif xs.__class__ == Set:
+        raise TypeError("cannot assoc in a set, use conj")
+    return List.cons(List.cons(key, value), dissoc(scope, Value(xs), Value(key)))
+scope["assoc"] = assoc
+
+def dissoc(scope, xs, key):
+    xs, key = xs.evaluate(scope), key.evaluate(scope)
+    if xs.__class__ == Map or xs.__class__ == Set:
+        return xs.dissoc(key)
+    return List([pair for pair in xs if not pair.car() == key] + [[]])
+scope["dissoc"] = dissoc
+
+def keys(scope, xs):
+    xs = xs.evaluate(scope)
+    if xs.__class__ == Map or xs.__class__ == Set:
+        return List([key for key, value in xs.entries()] + [[]])
+    return List([pair.car() for pair in xs] + [[]])
+scope["keys"] = keys
+
+def vals(scope, xs):
+    xs = xs.evaluate(scope)
+    if xs.__class__ == Map or xs.__class__ == Set:
+        return List([value for key, value in xs.entries()] + [[]])
+    return List([pair.cdr() for pair in xs] + [[]])
+scope["vals"] = vals
+
+def conj(scope, xs, *x):
+    # Add items to a set, (key . value) pairs to a map, items to the end
+    # of a vector, or items to the front of a list
+    xs = xs.evaluate(scope)
+    for i in x:
+        i = i.evaluate(scope)
+        if xs.__class__ == Set or xs.__class__ == Vector:
+            xs = xs.conj(i)
+        elif xs.__class__ == Map:
+            xs = xs.assoc(i.car(), i.cdr())
+        else:
+            xs = List.cons(i, xs)
+    return xs
+scope["conj"] = conj
+
+def disj(scope, xs, *x):
+    xs = xs.evaluate(scope)
+    for i in x:
+        xs = xs.dissoc(i.evaluate(scope))
+    return xs
+scope["disj"] = disj
+
+# Vector functions
+
+def vector(scope, *x):
+    return Vector([i.evaluate(scope) for i in x])
+scope["vector"] = vector
+
+def vec(scope, xs):
+    xs = xs.evaluate(scope)
+    if xs.__class__ == Vector:
+        return xs
+    return Vector(xs)
+scope["vec"] = vec
+
+def subvec(scope, xs, start, *end):
+    # O(1), as the vector made shares the items of xs
+    xs, start = xs.evaluate(scope), start.evaluate(scope).data
+    if len(end):
+        end = end[0].evaluate(scope).data
+    else:
+        end = xs.count()
+    return xs.subvec(start, end)
+scope["subvec"] = subvec
+
+natives = dict((name, scope[name]) for name in
+               ["map", "filter", "reduce", "count", "nth", "last", "append",
+                "concat", "reverse", "range", "contains?", "take",
+                "take-while", "drop", "iterate", "get", "assoc", "dissoc",
+                "keys", "vals"])
+
 # String functions
 
 def format(scope, s, *a):
     s = s.evaluate(scope).data
-    a = [x.evaluate(scope).data for x in a]
+    a = [x.evaluate(scope) for x in a]
+    # Atoms are formatted as their Python values, and lists, maps, sets,
+    # vectors, streams and futures as they are printed
+    a = [x.__class__ in (List, LazySeq, Map, Set, Vector, Stream, Future) and x or x.data for x in a]
     return String(s % tuple(a))
 scope["format"] = format
 
@@ -264,10 +863,7 @@ def repr_(scope, x):
 scope["repr"] = repr_
 
 def str_(scope, *x):
-    acc = ''
-    for i in x:
-        acc += str(i.evaluate(scope))
-    return String(acc)
+    return String("".join([str(i.evaluate(scope)) for i in x]))
 scope["str"] = str_
 
 def chr_(scope, x):
@@ -278,33 +874,180 @@ def ord_(scope, x):
     return Number(ord(x.evaluate(scope).data))
 scope["ord"] = ord_
 
+def str_to_list(scope, s):
+    return List(list(s.evaluate(scope)) + [[]])
+scope["str-to-list"] = str_to_list
+natives["str-to-list"] = str_to_list
+
 # Stream functions
 
-scope["*standard-output*"] = sys.stdout
-scope["*standard-error*"] = sys.stderr
-scope["*standard-input*"] = sys.stdin
-scope["*out*"] = sys.stdout
-scope["*in*"] = sys.stdin
+# Streams that buffer their output, which is written out before the
+# REPL prompts (see lispy.py) and on exit
+buffered = weakref.WeakSet()
+
+def buffered_stream(f):
+    stream = Stream(f, buffered=True)
+    buffered.add(stream)
+    return stream
+
+def flush_output():
+    for stream in list(buffered):
+        stream.drain()
+atexit.register(flush_output)
+
+# Output to a terminal is not buffered, so that it is seen as it is made
+if sys.stdout.isatty():
+    scope["*standard-output*"] = Stream(sys.stdout)
+else:
+    scope["*standard-output*"] = buffered_stream(sys.stdout)
+scope["*standard-error*"] = Stream(sys.stderr)
+scope["*standard-input*"] = Stream(sys.stdin)
+scope["*out*"] = scope["*standard-output*"]
+scope["*in*"] = scope["*standard-input*"]
 
 def print_(scope, x):
     scope["*out*"].write(str(x.evaluate(scope)))
     return nil
 scope["print"] = print_
 
-def read_line(scope):
-    s = ""
-    while True:
-        c = scope["*in*"].read(1)
-        if c == '\n':
-            break
-        s += c
-    return String(s)
+def read_line(scope, *stream):
+    # From *in*, unless given a stream
+    if len(stream):
+        stream = stream[0].evaluate(scope)
+    else:
+        stream = scope["*in*"]
+    line = stream.read_line()
+    if line is None:
+        return nil
+    return String(line)
 scope["read-line"] = read_line
 
+def line_seq(scope, *stream):
+    # The lines left in a stream, read as they are needed and kept in the
+    # sequence's cells, so that it always has the same lines
+    if len(stream):
+        stream = stream[0].evaluate(scope)
+    else:
+        stream = scope["*in*"]
+    return LazySeq(stream.lines)
+scope["line-seq"] = line_seq
+
+def mapped(f):
+    # A memory map of a file opened for reading, which reads lines about
+    # three times as fast as the file does, or None for files that cannot
+    # be mapped, such as pipes and empty files
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError, OverflowError):
+        return None
+
+def open_(scope, filename, *mode):
+    filename = filename.evaluate(scope).data
+    if len(mode):
+        mode = mode[0].evaluate(scope).data
+    else:
+        mode = "r"
+    f = open(filename, mode)
+    if mode in ("r", "rb"):
+        return Stream(f, mapped(f))
+    return buffered_stream(f)
+scope["open"] = open_
+
+def flush(scope, *stream):
+    # *out*, unless given a stream
+    if len(stream):
+        stream = stream[0].evaluate(scope)
+    else:
+        stream = scope["*out*"]
+    stream.flush()
+    return nil
+scope["flush"] = flush
+
+def close(scope, stream):
+    stream.evaluate(scope).close()
+    return nil
+scope["close"] = close
+
+def with_open(scope, bindings, *exprs):
+    # Like let, closing the streams bound when the body is left
+    local = Scope(scope)
+    streams = []
+    try:
+        for pair in bindings:
+            stream = pair.cdr().car().evaluate(local)
+            streams.append(stream)
+            local[pair.car().data] = stream
+        for expr in exprs[:-1]:
+            expr.evaluate(local)
+        # Not a tail call, which would be made after the streams are closed
+        return exprs[-1].evaluate(local)
+    finally:
+        for stream in reversed(streams):
+            stream.close()
+scope["with-open"] = with_open
+
+def read_file(scope, filename):
+    # Reading a whole file at once is faster than copying a memory map of
+    # it, so the file is not mapped
+    f = open(filename.evaluate(scope).data)
+    try:
+        return String(f.read())
+    finally:
+        f.close()
+scope["read-file"] = read_file
+
+# Concurrency functions
+
+# How many threads futures are evaluated on
+future_threads = 32
+
+pool = None
+
+def thread_pool():
+    # Started the first time it is needed
+    global pool
+    if pool is None:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(future_threads)
+    return pool
+
+def spawn(thunk):
+    # A future of calling thunk on the pool, in this thread's interpreter
+    # and with the dynamic vars bound in this thread
+    current = interpreter()
+    bindings = current.scope.threads.bindings
+    def run():
+        with current:
+            current.scope.threads.bindings = bindings
+            try:
+                return thunk()
+            finally:
+                current.scope.threads.bindings = None
+    return Future(thread_pool().apply_async(run))
+
+def future(local, *exprs):
+    def body():
+        for expr in exprs[:-1]:
+            expr.evaluate(local)
+        return exprs[-1].evaluate(local)
+    return spawn(body)
+scope["future"] = future
+
+def deref(scope, x):
+    return x.evaluate(scope).deref()
+scope["deref"] = deref
+
+def future_done(scope, x):
+    if x.evaluate(scope).done():
+        return t
+    return nil
+scope["future-done?"] = future_done
+
 # Type predicates
 
 def listp(scope, x):
-    if x.evaluate(scope).__class__ == List:
+    # Lazy sequences are lists too
+    if x.evaluate(scope).__class__ in (List, LazySeq):
         return t
     return nil
 scope["list?"] = listp
@@ -350,3 +1093,33 @@ def macrop(scope, x):
         return t
     return nil
 scope["macro?"] = macrop
+
+def mapp(scope, x):
+    if x.evaluate(scope).__class__ == Map:
+        return t
+    return nil
+scope["map?"] = mapp
+
+def setp(scope, x):
+    if x.evaluate(scope).__class__ == Set:
+        return t
+    return nil
+scope["set?"] = setp
+
+def vectorp(scope, x):
+    if x.evaluate(scope).__class__ == Vector:
+        return t
+    return nil
+scope["vector?"] = vectorp
+
+def streamp(scope, x):
+    if x.evaluate(scope).__class__ == Stream:
+        return t
+    return nil
+scope["stream?"] = streamp
+
+def futurep(scope, x):
+    if x.evaluate(scope).__class__ == Future:
+        return t
+    return nil
+scope["future?"] = futurep
@@ -0,0 +1,247 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Hash array mapped tries, the persistent maps behind hash maps and sets.
+#
+# A trie node has a slot for each 5 bits of a key's hash, taken from the
+# low bits at the root up. Only the slots in use are stored: bit i of a
+# node's bitmap is set if slot i is, and `array` holds a key and a value
+# for each slot in use, in order. Where two keys share a slot, the key is
+# None and the value is a node one level down. Keys whose whole hashes
+# are the same end up in a collision node, which holds them in a flat
+# array.
+#
+# Nodes are never changed once made, so assoc and without copy the nodes
+# on the path to the key and share the rest, and take O(log n) time.
+# Tries are made of nodes and None, the empty trie.
+
+bits = 5
+mask = (1 << bits) - 1
+
+def hash_of(key):
+    return hash(key) & 0xffffffff
+
+# The number of bits set in each 16 bit number. Numbers with the top bit
+# set have one more than those without it.
+counts = [0]
+for i in range(16):
+    counts += [c + 1 for c in counts]
+
+def bit_count(x):
+    # Of a 32 bit number
+    return counts[x & 0xffff] + counts[x >> 16]
+
+class Node(object):
+    __slots__ = ("bitmap", "array")
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+    def find(self, key, h, shift, default):
+        # The most used operation, so bit_count is inlined
+        node = self
+        while True:
+            bitmap = node.bitmap
+            bit = 1 << ((h >> shift) & mask)
+            if not bitmap & bit:
+                return default
+            below = bitmap & (bit - 1)
+            i = 2 * (counts[below & 0xffff] + counts[below >> 16])
+            array = node.array
+            k = array[i]
+            if k is None:
+                node = array[i + 1]
+                if node.__class__ is Collision:
+                    return node.find(key, h, shift, default)
+                shift += bits
+            elif k is key or k == key:
+                return array[i + 1]
+            else:
+                return default
+
+    def assoc(self, key, h, shift, value):
+        # The node with key bound to value, and whether key was added
+        bitmap, array = self.bitmap, self.array
+        bit = 1 << ((h >> shift) & mask)
+        i = 2 * bit_count(bitmap & (bit - 1))
+        if not bitmap & bit:
+            return Node(bitmap | bit, array[:i] + (key, value) + array[i:]), True
+        k, v = array[i], array[i + 1]
+        if k is None:
+            node, added = v.assoc(key, h, shift + bits, value)
+            if node is v:
+                return self, False
+            return Node(bitmap, array[:i + 1] + (node,) + array[i + 2:]), added
+        if k is key or k == key:
+            if v is value:
+                return self, False
+            return Node(bitmap, array[:i + 1] + (value,) + array[i + 2:]), False
+        # The slot is taken by another key, so both go one level down
+        node = pair(shift + bits, k, hash_of(k), v, key, h, value)
+        return Node(bitmap, array[:i] + (None, node) + array[i + 2:]), True
+
+    def without(self, key, h, shift):
+        # The node without key, or None if that leaves it empty
+        bitmap, array = self.bitmap, self.array
+        bit = 1 << ((h >> shift) & mask)
+        if not bitmap & bit:
+            return self
+        i = 2 * bit_count(bitmap & (bit - 1))
+        k, v = array[i], array[i + 1]
+        if k is None:
+            node = v.without(key, h, shift + bits)
+            if node is v:
+                return self
+            if node is not None:
+                return Node(bitmap, array[:i + 1] + (node,) + array[i + 2:])
+        elif not (k is key or k == key):
+            return self
+        if bitmap == bit:
+            return None
+        return Node(bitmap ^ bit, array[:i] + array[i + 2:])
+
+    def __iter__(self):
+        # The key and value of each entry
+        array = self.array
+        for i in xrange(0, len(array), 2):
+            if array[i] is None:
+                for entry in array[i + 1]:
+                    yield entry
+            else:
+                yield array[i], array[i + 1]
+
+class Collision(object):
+    # Keys with the same hash
+    __slots__ = ("hash", "array")
+
+    def __init__(self, h, array):
+        self.hash = h
+        self.array = array
+
+    def index(self, key):
+        array = self.array
+        for i in xrange(0, len(array), 2):
+            if array[i] is key or array[i] == key:
+                return i
+        return None
+
+    def find(self, key, h, shift, default):
+        if h == self.hash:
+            i = self.index(key)
+            if i is not None:
+                return self.array[i + 1]
+        return default
+
+    def assoc(self, key, h, shift, value):
+        if h != self.hash:
+            # Put the collision node in a node of its own, next to the key
+            node = Node(1 << ((self.hash >> shift) & mask), (None, self))
+            return node.assoc(key, h, shift, value)
+        i = self.index(key)
+        if i is None:
+            return Collision(h, self.array + (key, value)), True
+        if self.array[i + 1] is value:
+            return self, False
+        return Collision(h, self.array[:i + 1] + (value,) + self.array[i + 2:]), False
+
+    def without(self, key, h, shift):
+        if h != self.hash:
+            return self
+        i = self.index(key)
+        if i is None:
+            return self
+        if len(self.array) == 2:
+            return None
+        return Collision(h, self.array[:i] + self.array[i + 2:])
+
+    def __iter__(self):
+        array = self.array
+        for i in xrange(0, len(array), 2):
+            yield array[i], array[i + 1]
+
+def pair(shift, k1, h1, v1, k2, h2, v2):
+    # A node holding two keys, from shift on
+    if h1 == h2:
+        return Collision(h1, (k1, v1, k2, v2))
+    f1, f2 = (h1 >> shift) & mask, (h2 >> shift) & mask
+    if f1 == f2:
+        return Node(1 << f1, (None, pair(shift + bits, k1, h1, v1, k2, h2, v2)))
+    if f1 < f2:
+        return Node((1 << f1) | (1 << f2), (k1, v1, k2, v2))
+    return Node((1 << f1) | (1 << f2), (k2, v2, k1, v1))
+
+def build(entries):
+    # A trie of (key, value) pairs, later pairs replacing earlier ones, and
+    # its number of entries. Each node is made once, rather than copied for
+    # each pair as assoc would.
+    items = [(hash_of(key), key, value) for key, value in entries]
+    if not len(items):
+        return None, 0
+    return build_node(items, 0)
+
+def build_node(items, shift):
+    # A node of (hash, key, value) items, whose hashes agree below shift
+    buckets = {}
+    for item in items:
+        buckets.setdefault((item[0] >> shift) & mask, []).append(item)
+    bitmap = 0
+    array = []
+    count = 0
+    for fragment in sorted(buckets):
+        bitmap |= 1 << fragment
+        bucket = buckets[fragment]
+        if len(bucket) == 1:
+            h, key, value = bucket[0]
+            n = 1
+        else:
+            key, value, n = build_slot(bucket, shift + bits)
+        array.append(key)
+        array.append(value)
+        count += n
+    return Node(bitmap, tuple(array)), count
+
+def build_slot(items, shift):
+    # The key and value of a slot of a node holding items, which are
+    # either a single entry or None and a node, and its number of entries
+    h = items[0][0]
+    for item in items:
+        if item[0] != h:
+            return (None,) + build_node(items, shift)
+    # Keys with the same hash, which may be the same key more than once
+    array = []
+    for h, key, value in items:
+        for i in xrange(0, len(array), 2):
+            if array[i] is key or array[i] == key:
+                array[i + 1] = value
+                break
+        else:
+            array.append(key)
+            array.append(value)
+    if len(array) == 2:
+        return array[0], array[1], 1
+    return None, Collision(h, tuple(array)), len(array) / 2
+
+# Operations on tries, including the empty one
+
+def find(trie, key, default=None):
+    if trie is None:
+        return default
+    return trie.find(key, hash_of(key), 0, default)
+
+def assoc(trie, key, value):
+    # The trie with key bound to value, and whether key was added
+    h = hash_of(key)
+    if trie is None:
+        return Node(1 << (h & mask), (key, value)), True
+    return trie.assoc(key, h, 0, value)
+
+def without(trie, key):
+    if trie is None:
+        return None
+    return trie.without(key, hash_of(key), 0)
+
+def entries(trie):
+    if trie is None:
+        return iter(())
+    return iter(trie)
@@ -0,0 +1,155 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Startup images. Loading the core means reading and evaluating every
+# form in core.lisp, which is most of the time a short script takes to
+# run. An image is a pickle of the global bindings the core adds or
+# changes, saved next to the core file (core.lisp -> core.tree.lispc,
+# core.compiled.lispc) and loaded instead of evaluating the core when the core file, the
+# interpreter and the engine are the same as when it was saved.
+
+import os
+import sys
+import hashlib
+import cPickle as pickle
+from cStringIO import StringIO
+
+from ast import Lambda
+import core
+import compiler
+
+# Bump when the layout of images changes
+format_version = 2
+
+def table(bindings, scope):
+    # The values pickled by name, and the name of each by id
+    named = {"*scope*": scope, "*unbound*": compiler.unbound}
+    named.update(bindings)
+    return named, dict((id(value), name) for name, value in named.items())
+
+# The global bindings made by core.py, before any core is loaded, which
+# every interpreter starts with. These (and the global scope itself) are
+# pickled by name, as they are either Python functions and streams or
+# values compared by identity.
+initial = dict(core.scope.bindings)
+named, names = table(initial, core.scope)
+
+# The interpreter modules, whose source is part of the key
+modules = ["ast", "hamt", "core", "compiler", "parallel", "profiler", "metrics", "scope", "reader", "image"]
+
+def dumps(x, names):
+    # Pickle x, with the values in names pickled by their name. The code
+    # of lambdas made by compiled code is not pickled, but the context to
+    # compile it again in is.
+    compiled = {}
+    def persistent_id(obj):
+        if isinstance(obj, Lambda) and obj.code is not None:
+            compiled[id(obj)] = (obj, obj.code.ctx)
+        return names.get(id(obj))
+    f = StringIO()
+    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    limit = sys.getrecursionlimit()
+    # Lists are pickled one cell at a time
+    sys.setrecursionlimit(max(limit, 20000))
+    try:
+        pickler.dump(x)
+        pickler.dump(compiled.values())
+    finally:
+        sys.setrecursionlimit(limit)
+    return f.getvalue()
+
+def loads(s, named):
+    # Unpickle what dumps pickled, with the values named by name
+    unpickler = pickle.Unpickler(StringIO(s))
+    unpickler.persistent_load = named.__getitem__
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 20000))
+    try:
+        x = unpickler.load()
+        for l, ctx in unpickler.load():
+            compiler.recompile(l, ctx)
+    finally:
+        sys.setrecursionlimit(limit)
+    return x
+
+def variant(engine):
+    # Lambdas made with --expand-macros have their bodies expanded
+    if core.expand_bodies:
+        return engine + "+expand-macros"
+    return engine
+
+def filename(core_filename, engine):
+    # Each engine has its own image, so they don't replace each other's
+    root, ext = os.path.splitext(core_filename)
+    return "%s.%s%sc" % (root, variant(engine), ext or ".lisp")
+
+def key(core_filename, engine):
+    # Identifies the core, the interpreter and the engine an image is of
+    digest = hashlib.sha1()
+    f = open(core_filename, "rb")
+    digest.update(f.read())
+    f.close()
+    for name in modules:
+        path = os.path.splitext(sys.modules[name].__file__)[0] + ".py"
+        if os.path.exists(path):
+            f = open(path, "rb")
+            digest.update(f.read())
+            f.close()
+    return "lispy image %d %s %s %s" % (format_version, variant(engine), digest.hexdigest(),
+                                        sys.version.split()[0])
+
+def load(core_filename, engine):
+    # Bind the contents of the image of a core in this thread's
+    # interpreter, if it is up to date. Returns whether it was loaded.
+    scope = core.interpreter().scope
+    scope_named = dict(named)
+    scope_named["*scope*"] = scope
+    try:
+        f = open(filename(core_filename, engine), "rb")
+    except IOError:
+        return False
+    try:
+        if f.readline().rstrip("\n") != key(core_filename, engine):
+            return False
+        bindings, removed = loads(f.read(), scope_named)
+    except Exception:
+        # A broken image is rebuilt, not an error
+        return False
+    finally:
+        f.close()
+    for name in removed:
+        del(scope[name])
+    scope.bindings.update(bindings)
+    return True
+
+def save(core_filename, engine):
+    # Save the global bindings made by loading a core in this thread's
+    # interpreter as its image. Returns whether it was saved.
+    scope = core.interpreter().scope
+    bindings = {}
+    for name, value in scope.bindings.items():
+        if initial.get(name) is not value:
+            bindings[name] = value
+    removed = [name for name in initial if not scope.has_key(name)]
+    scope_names = dict(names)
+    scope_names[id(scope)] = "*scope*"
+    path = filename(core_filename, engine)
+    temp = "%s.%d" % (path, os.getpid())
+    try:
+        data = dumps((bindings, removed), scope_names)
+        f = open(temp, "wb")
+        try:
+            f.write(key(core_filename, engine) + "\n")
+            f.write(data)
+        finally:
+            f.close()
+        os.rename(temp, path)
+    except Exception:
+        # Not being able to save an image is not an error either
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return False
+    return True
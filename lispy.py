@@ -4,6 +4,8 @@
 
 import sys
 import getopt
+import atexit
+import socket
 import traceback
 try:
     import readline
@@ -12,45 +14,102 @@ except ImportError:
 
 from reader import Reader
 import core
+import compiler
+import parallel
+import profiler
+import metrics
+# After the modules that add builtins (see image.initial)
+import image
+import server
+
+# How forms are evaluated: "tree" walks the AST, "compiled" compiles each
+# form to closures first
+engine = "tree"
+
+def evaluate_form(expr):
+    if engine == "compiled":
+        return compiler.evaluate(expr)
+    return expr.evaluate(core.interpreter().scope)
+
+def chunks(f, size=65536):
+    # The contents of a file, a chunk at a time
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+# Whether to evaluate the core even if it has an up to date image
+rebuild_image = False
 
 def load_lisp_core(filename="core.lisp"):
-    # Load up and evaluate core.lisp
-    f = open(filename)
-    reader = Reader(f.read(), filename)
-    f.close()
-    for expr in reader.read():
-        expr.evaluate(core.scope)
+    # Load the core in this thread's interpreter. The image cannot replay
+    # what the core prints when starting a REPL.
+    current = core.interpreter()
+    use_image = current.scope["*repl*"] == core.nil
+    if not (use_image and not rebuild_image and image.load(filename, engine)):
+        # Load up and evaluate core.lisp, which can define its own versions
+        # of the native builtins
+        f = open(filename)
+        current.loading_core = True
+        try:
+            for expr in Reader(filename=filename).forms(chunks(f)):
+                evaluate_form(expr)
+        finally:
+            current.loading_core = False
+        f.close()
+        if use_image:
+            image.save(filename, engine)
+    # Workers of pmap and preduce have the same core
+    if current is core.main:
+        parallel.loaded(filename, engine)
+    # What loading the core took is not part of the profile, or of the
+    # metrics
+    profiler.reset()
+    profiler.samples.clear()
+    metrics.reset()
+
+def make_interpreter(filename="core.lisp"):
+    # A new interpreter, with the builtins and the core loaded, whose
+    # globals are its own (see Interpreter in core.py). Evaluate in it
+    # with `with`:
+    #
+    #     with interpreter:
+    #         evaluate_form(form)
+    interpreter = core.Interpreter(core.GlobalScope(dict(image.initial)))
+    with interpreter:
+        load_lisp_core(filename)
+    return interpreter
 
 def repl():
     global EOFError
-    source = ""
+    reader = Reader()
     while True:
-        # Get a new source line
+        # Get a new source line, after the output so far
+        core.flush_output()
         try:
-            if source == "":
-                source = raw_input("=> ") + '\n'
+            if not reader.partial():
+                line = raw_input("=> ") + '\n'
             else:
-                source += raw_input() + '\n'
+                line = raw_input() + '\n'
         except KeyboardInterrupt, EOFError:
             break
-        # Read the source line
-        reader = Reader(source)
+        # Read the forms the source line completes
         try:
-            exprs = reader.read()
-        except EOFError:
-            # Need more input
-            continue
+            exprs = reader.feed(line)
         except Exception, e:
             print e
-            source = ""
+            reader = Reader()
             continue
         # Evaluate the source line
         for expr in exprs:
             try:
-                print repr(expr.evaluate(core.scope))
+                value = evaluate_form(expr)
+                core.flush_output()
+                print repr(value)
             except Exception, e:
+                core.flush_output()
                 traceback.print_exc()
-        source = ""
 
 def evaluate(expr):
     reader = Reader(expr)
@@ -61,8 +120,11 @@ def evaluate(expr):
         return
     for expr in exprs:
         try:
-            print repr(expr.evaluate(core.scope))
+            value = evaluate_form(expr)
+            core.flush_output()
+            print repr(value)
         except Exception, e:
+            core.flush_output()
             print e
             return
 
@@ -72,20 +134,35 @@ def evaluate_file(filename):
     except IOError:
         print "Cannot open file %s" % repr(filename)
         return
-    reader = Reader(f.read())
-    f.close()
-    try:
-        exprs = reader.read()
-    except Exception, e:
-        print e
-        return
-    for expr in exprs:
+    # Each form is evaluated as soon as it is read
+    forms = Reader(filename=filename).forms(chunks(f))
+    while True:
         try:
-            expr.evaluate(core.scope)
+            expr = forms.next()
+        except StopIteration:
+            break
         except Exception, e:
+            print e
+            break
+        try:
+            evaluate_form(expr)
+        except Exception, e:
+            core.flush_output()
             traceback.print_exc()
-            return
-        
+            break
+    f.close()
+
+def serve_request(request):
+    # In the process the server forked for a request, whose output goes
+    # to the client, and is buffered even if the server's is not
+    if core.scope["*standard-output*"].buffer is None:
+        core.scope["*standard-output*"] = core.scope["*out*"] = core.buffered_stream(sys.stdout)
+    if request.has_key("evaluate"):
+        evaluate(request["evaluate"])
+    else:
+        evaluate_file(request["file"])
+    core.flush_output()
+
 def help():
     print "Usage: %s [options] file" % sys.argv[0]
     print "       %s [options] -r" % sys.argv[0]
@@ -95,18 +172,36 @@ def help():
     print "  -e EXPR, --evaluate=EXPR    Evaluate a single expression"
     print "  -n, --no-core               Do not load lisp core"
     print "  -c FILE, --core=FILE        Load the core from a different file"
+    print "  --engine=ENGINE             Evaluate by walking the AST (tree, default)"
+    print "                              or by compiling to closures (compiled)"
+    print "  --rebuild-image             Evaluate the core and save its image again"
+    print "  -j N, --jobs=N              Run pmap and preduce in N processes (default:"
+    print "                              one for each CPU)"
+    print "  --expand-macros             Expand the macro calls in the body of each"
+    print "                              lambda when it is made"
+    print "  --profile                   Count and time the calls to each function,"
+    print "                              and report them on exit"
+    print "  --sample=FILE               Sample the functions being called, and write"
+    print "                              their stacks to FILE on exit, for flame graphs"
+    print "  --metrics=FILE              Count what the interpreter does, and write the"
+    print "                              counts to FILE as JSON on exit"
+    print "  --server=SOCKET             Evaluate the requests of clients on a Unix"
+    print "                              socket, with the core loaded once (see server.py)"
+    print "  --connections=N             Evaluate at most N requests to the server at"
+    print "                              once (default: 8)"
     print "  --version                   Print version information and exit"
     print
         
 def main(argv):
     # Parse command line arguments
     try:
-        opts, args = getopt.getopt(argv, "e:rnc:h", ["evaluate=", "repl", "no-core", "core=", "help", "version"])
+        opts, args = getopt.getopt(argv, "e:rnc:j:h", ["evaluate=", "repl", "no-core", "core=", "engine=", "rebuild-image", "expand-macros", "jobs=", "profile", "sample=", "metrics=", "server=", "connections=", "help", "version"])
     except getopt.GetoptError, err:
         print '%s\n' % err
         help()
         sys.exit(1)
 
+    global engine, rebuild_image
     load_core = True
     core_filename = "core.lisp"
         
@@ -115,6 +210,48 @@ def main(argv):
             load_core = False
         elif opt in ("-c", "--core"):
             core_filename = arg
+        elif opt == "--engine":
+            if arg not in ("tree", "compiled"):
+                print "Unknown engine %s\n" % repr(arg)
+                help()
+                sys.exit(1)
+            engine = arg
+        elif opt == "--rebuild-image":
+            rebuild_image = True
+        elif opt == "--expand-macros":
+            core.expand_bodies = True
+        elif opt in ("-j", "--jobs"):
+            if not arg.isdigit() or int(arg) < 1:
+                print "Expected a number of jobs, got %s\n" % repr(arg)
+                help()
+                sys.exit(1)
+            parallel.jobs = int(arg)
+        elif opt == "--profile":
+            profiler.start()
+            atexit.register(profiler.report_on_exit)
+        elif opt == "--sample":
+            profiler.start_sampling()
+            atexit.register(profiler.write_samples, arg)
+        elif opt == "--metrics":
+            metrics.enable()
+            atexit.register(metrics.dump, arg)
+        elif opt == "--connections":
+            if not arg.isdigit() or int(arg) < 1:
+                print "Expected a number of connections, got %s\n" % repr(arg)
+                help()
+                sys.exit(1)
+            server.connections = int(arg)
+        elif opt == "--server":
+            if load_core:
+                load_lisp_core(core_filename)
+            try:
+                server.serve(arg, serve_request)
+            except KeyboardInterrupt:
+                pass
+            except socket.error, e:
+                print "Cannot listen on %s: %s" % (repr(arg), e)
+                sys.exit(1)
+            sys.exit()
         elif opt in ("-e", "--evaluate"):
             if load_core:
                 load_lisp_core(core_filename)
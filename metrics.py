@@ -0,0 +1,112 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Interpreter metrics, counted once enabled with --metrics: how many
+# times each kind of node is evaluated, scopes made, variables looked up
+# in scopes and through how many scopes, lambdas called, macros
+# expanded, list cells made and tokens read. As in profiler.py, counting
+# replaces the methods that do these, so nothing is counted, and there
+# is nothing to pay, until metrics are enabled.
+
+import types
+import threading
+
+from ast import *
+from scope import Scope, GlobalScope
+import core
+import reader
+
+enabled = False
+
+# The counters that are always there, as well as one for each kind of
+# node evaluated
+names = ["scopes", "lookups", "lookup-depth", "lambda-calls", "macro-expansions",
+         "list-cells", "reader-tokens"]
+
+counts = dict((name, 0) for name in names)
+
+def counter(name, method):
+    def counted(*args):
+        counts[name] += 1
+        return method(*args)
+    return counted
+
+def evaluate_counter(method):
+    def evaluate(self, scope):
+        name = "evaluate-" + self.__class__.__name__.lower()
+        counts[name] = counts.get(name, 0) + 1
+        return method(self, scope)
+    return evaluate
+
+def evaluate_tail_counter(method):
+    # Lists evaluated in tail position are only evaluated by evaluate
+    # when they are not calls
+    def evaluate_tail(self, scope):
+        if self.tail is not None and self.tail.__class__ == List:
+            counts["evaluate-list"] = counts.get("evaluate-list", 0) + 1
+        return method(self, scope)
+    return evaluate_tail
+
+# How many lookups each thread is in, as a lookup in a scope goes on in
+# its parent
+lookups = threading.local()
+
+def lookup_counter(method):
+    def __getitem__(self, key):
+        depth = getattr(lookups, "depth", 0)
+        if depth == 0:
+            counts["lookups"] += 1
+        counts["lookup-depth"] += 1
+        lookups.depth = depth + 1
+        try:
+            return method(self, key)
+        finally:
+            lookups.depth = depth
+    return __getitem__
+
+class Tokens:
+    # Counts the tokens the reader matches with its regular expression
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def finditer(self, source, pos):
+        for match in self.pattern.finditer(source, pos):
+            counts["reader-tokens"] += 1
+            yield match
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    # The classes of nodes, which are evaluated
+    for cls in globals().values():
+        if isinstance(cls, (type, types.ClassType)) and "evaluate" in cls.__dict__:
+            cls.evaluate = evaluate_counter(cls.__dict__["evaluate"])
+    List.evaluate_tail = evaluate_tail_counter(List.__dict__["evaluate_tail"])
+    for cls in (Scope, GlobalScope):
+        cls.__init__ = counter("scopes", cls.__dict__["__init__"])
+        cls.__getitem__ = lookup_counter(cls.__dict__["__getitem__"])
+    Lambda.invoke = counter("lambda-calls", Lambda.__dict__["invoke"])
+    Lambda.traced += 1
+    Macro.expand = counter("macro-expansions", Macro.__dict__["expand"])
+    List.__init__ = counter("list-cells", List.__dict__["__init__"])
+    List.cons = staticmethod(counter("list-cells", List.cons))
+    reader.tokens = Tokens(reader.tokens)
+    enabled = True
+
+def reset():
+    for name in counts:
+        counts[name] = 0
+
+def lispy_stats(scope):
+    # An association list of the counts, by name
+    return List([List([Keyword(name), Number(count)]) for name, count in sorted(counts.items())] + [[]])
+core.scope["lispy-stats"] = lispy_stats
+
+def dump(filename):
+    # Write the counts as JSON (see --metrics in lispy.py)
+    import json
+    f = open(filename, "w")
+    json.dump(counts, f, indent=2, separators=(",", ": "), sort_keys=True)
+    f.write("\n")
+    f.close()
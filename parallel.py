@@ -0,0 +1,183 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Parallel map and reduce over a pool of worker processes. pmap and
+# preduce split their items into chunks, and a worker calls the function
+# on each item of a chunk. The function is pickled with the global
+# bindings it refers to that the workers may not have: those made since
+# the core was loaded. Workers are forked from the interpreter, and have
+# its core and what was defined before the pool was started, or load the
+# core themselves where processes cannot be forked.
+#
+# Functions are called in other processes, so they should be pure:
+# changes they make to global bindings are not seen by the interpreter,
+# or by the other workers. The workers have the core of the first
+# interpreter (core.main), so in other interpreters pmap and preduce call
+# the function in this process.
+
+from ast import *
+import core
+
+# The number of workers, or None for one for each CPU (see --jobs)
+jobs = None
+
+# How many chunks the items are split into for each worker. More chunks
+# balance the work better when items take different times.
+chunks_per_worker = 4
+
+# The core the workers load, and the engine they load it with, if they
+# are not forked with it
+core_filename = None
+engine = "tree"
+
+# The global bindings once the core is loaded, which the workers have
+# too, so they are pickled by name
+baseline = {}
+named = {}
+names = {}
+
+def snapshot():
+    # image is imported once the core is loaded, as it takes the bindings
+    # every interpreter starts with when it is first imported
+    import image
+    global baseline, named, names
+    baseline = dict(core.scope.bindings)
+    named, names = image.table(baseline, core.scope)
+
+# Whether the core is loaded
+ready = False
+
+def loaded(filename, engine_):
+    # Called once the core is loaded (see lispy.py)
+    global core_filename, engine, ready
+    core_filename, engine = filename, engine_
+    snapshot()
+    ready = True
+
+def dumps(x):
+    import image
+    return image.dumps(x, names)
+
+def loads(s):
+    import image
+    return image.loads(s, named)
+
+def symbols(x):
+    # The names of the symbols in a form, or in the body of a lambda
+    forms = [x]
+    while len(forms):
+        x = forms.pop()
+        if x.__class__ == Symbol:
+            yield x.data
+        elif x.__class__ == List:
+            while x.__class__ == List and x.tail is not None:
+                forms.append(x.head)
+                x = x.tail
+            # The cdr of an improper list
+            if x.__class__ != List:
+                forms.append(x)
+        elif x.__class__ == Map:
+            for key, value in x.entries():
+                forms.append(key)
+                forms.append(value)
+        elif x.__class__ in (Set, Vector):
+            forms.extend(x)
+        elif isinstance(x, Lambda):
+            forms.append(x.bindings)
+            forms.extend(x.body)
+
+def required(f):
+    # The global bindings f refers to, directly or through other global
+    # bindings, that are not in the baseline
+    bindings = {}
+    values = [f]
+    while len(values):
+        for name in symbols(values.pop()):
+            if name in bindings or not core.scope.has_key(name):
+                continue
+            value = core.scope[name]
+            if baseline.get(name) is not value:
+                bindings[name] = value
+                values.append(value)
+    return bindings
+
+pool = None
+workers = None
+
+def start():
+    # The pool of workers, started the first time it is needed
+    global pool, workers
+    if pool is None:
+        import multiprocessing
+        workers = jobs or multiprocessing.cpu_count()
+        # Forked workers would write out the output buffered so far again
+        core.flush_output()
+        pool = multiprocessing.Pool(workers, start_worker, (core_filename, engine))
+    return pool
+
+def start_worker(filename, engine_):
+    # Workers that are not forked from the interpreter load the core
+    if filename is not None and not ready:
+        import lispy
+        lispy.engine = engine_
+        lispy.load_lisp_core(filename)
+
+# In a worker, the last function it was sent, pickled and not
+function = [None, None]
+
+def run(task):
+    # In a worker, call a function on each item of a chunk, or reduce the
+    # chunk with it
+    kind, pickled, items = task
+    if function[0] != pickled:
+        f, bindings = loads(pickled)
+        core.scope.bindings.update(bindings)
+        function[:] = [pickled, f]
+    f = function[1]
+    items = loads(items)
+    if kind == "map":
+        results = [core.call(core.scope, f, x) for x in items]
+    else:
+        results = items[0]
+        for x in items[1:]:
+            results = core.call(core.scope, f, results, x)
+    core.flush_output()
+    return dumps(results)
+
+def run_all(kind, f, items):
+    # The results of each chunk of items, in order
+    pool = start()
+    n = workers * chunks_per_worker
+    size = (len(items) + n - 1) / n
+    pickled = dumps((f, required(f)))
+    tasks = [(kind, pickled, dumps(items[i:i + size])) for i in xrange(0, len(items), size)]
+    # Waiting with a timeout lets KeyboardInterrupt through
+    results = pool.map_async(run, tasks).get(1e9)
+    return [loads(x) for x in results]
+
+def serial(items):
+    # Whether to call the function in this process: one worker would only
+    # add the cost of sending items to it
+    return jobs == 1 or len(items) < 2 or core.interpreter() is not core.main
+
+def pmap(scope, f, xs):
+    f, xs = f.evaluate(scope), xs.evaluate(scope)
+    items = list(xs)
+    if serial(items):
+        return List([core.call(scope, f, x) for x in items] + [[]])
+    results = []
+    for chunk in run_all("map", f, items):
+        results.extend(chunk)
+    return List(results + [[]])
+core.scope["pmap"] = pmap
+
+def preduce(scope, f, xs, *x):
+    # Chunks are reduced by the workers, and their results by the
+    # interpreter, so f must be associative. An initial value is only
+    # used once, in the last step.
+    f, xs = f.evaluate(scope), xs.evaluate(scope)
+    items = list(xs)
+    if not serial(items):
+        items = run_all("reduce", f, items)
+    return core.reduce_(scope, Value(f), Value(List(items + [[]])), *x)
+core.scope["preduce"] = preduce
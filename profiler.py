@@ -0,0 +1,239 @@
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Profilers of calls to lambdas and macro expansions.
+#
+# While profiling, the
+# methods that call lambdas and expand macros are replaced by ones that
+# count and time them, so that there is nothing to pay when not
+# profiling. Calls are recorded by the name the lambda or macro was first
+# bound to with def, and where it was read from.
+#
+# The time of a call is inclusive of the calls it makes, and exclusive
+# of them. Inclusive times of recursive calls are only counted once, for
+# the outermost call. A tail call is made once the function making it
+# has returned, so it is counted as a call made by that function's
+# caller.
+#
+# While sampling, a timer interrupts the interpreter every
+# `sample_interval` seconds of CPU time and the lambdas and macros being
+# called are found in the Python stack of the main thread, the frames
+# of Lambda.invoke, compiled lambdas and Macro.expand. The stacks are
+# counted and written out collapsed, a line for each stack of the
+# functions' names separated by semicolons and its count, which is what
+# flame graph tools take.
+
+import time
+import signal
+import threading
+
+from ast import *
+import core
+
+# Whether calls are being recorded
+active = False
+
+invoke = Lambda.invoke
+expand = Macro.expand
+
+# The methods replaced while profiling, which may be those of metrics.py
+replaced = [invoke, expand]
+
+class ThreadProfile(threading.local):
+    # The calls being made in a thread, and what it has recorded
+    def __init__(self):
+        # The time spent in the calls made by each call being made
+        self.inner = []
+        # How many calls to each function are being made
+        self.depth = {}
+        # [calls, inclusive time, exclusive time] of each function
+        self.stats = {}
+        with core.lock:
+            profiles.append(self.stats)
+
+profiles = []
+thread = ThreadProfile()
+
+def timed(kind, f, method, args):
+    profile = thread
+    key = (kind, f.name, f.position)
+    depth = profile.depth.get(key, 0)
+    profile.depth[key] = depth + 1
+    inner = profile.inner
+    inner.append(0.0)
+    start = time.time()
+    try:
+        return method(f, *args)
+    finally:
+        elapsed = time.time() - start
+        exclusive = elapsed - inner.pop()
+        if len(inner):
+            inner[-1] += elapsed
+        profile.depth[key] = depth
+        entry = profile.stats.get(key)
+        if entry is None:
+            entry = profile.stats[key] = [0, 0.0, 0.0]
+        entry[0] += 1
+        if depth == 0:
+            entry[1] += elapsed
+        entry[2] += exclusive
+
+def profiled_invoke(self, scope, *args):
+    return timed("fn", self, replaced[0], (scope,) + args)
+
+def profiled_expand(self, scope, *args):
+    return timed("macro", self, replaced[1], (scope,) + args)
+
+def start():
+    global active
+    replaced[:] = [Lambda.invoke, Macro.expand]
+    Lambda.invoke = profiled_invoke
+    Macro.expand = profiled_expand
+    Lambda.traced += 1
+    active = True
+
+def stop():
+    global active
+    Lambda.invoke, Macro.expand = replaced
+    Lambda.traced -= 1
+    active = False
+
+def reset():
+    for stats in profiles:
+        stats.clear()
+
+def totals():
+    # The stats of every thread, added up
+    total = {}
+    for stats in list(profiles):
+        for key, (calls, inclusive, exclusive) in stats.items():
+            entry = total.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += inclusive
+            entry[2] += exclusive
+    return total
+
+columns = {"calls": 0, "inclusive": 1, "exclusive": 2}
+
+def report(stream, sort="exclusive"):
+    # Write the stats, the functions that took longest first
+    column = columns[sort]
+    rows = sorted(totals().items(), key=lambda (key, entry): entry[column], reverse=True)
+    stream.write("%10s %10s %10s  %s\n" % ("calls", "inclusive", "exclusive", "function"))
+    for (kind, name, position), (calls, inclusive, exclusive) in rows:
+        if name is None:
+            name = "(%s)" % kind
+        elif kind == "macro":
+            name += " (macro)"
+        if position is not None:
+            if position[0] is None:
+                name += " line %d" % position[1]
+            else:
+                name += " %s:%d" % position
+        stream.write("%10d %9.3fs %9.3fs  %s\n" % (calls, inclusive, exclusive, name))
+
+def profile(local, *exprs):
+    # Evaluate exprs, recording the calls made, unless they are already
+    # being recorded
+    return profile_thunk(lambda: core.do(local, *exprs))
+core.scope["profile"] = profile
+
+def profile_thunk(thunk):
+    if active:
+        return trampoline(thunk())
+    reset()
+    start()
+    try:
+        return trampoline(thunk())
+    finally:
+        stop()
+
+def profile_report(scope, *sort):
+    if len(sort):
+        sort = sort[0].evaluate(scope)
+        if sort.__class__ != Keyword or sort.data not in columns:
+            raise ValueError("expected :calls, :inclusive or :exclusive, got %s" % repr(sort))
+        sort = sort.data
+    else:
+        sort = "exclusive"
+    report(scope["*out*"], sort)
+    return core.nil
+core.scope["profile-report"] = profile_report
+
+def report_on_exit():
+    # Report to stderr, after the output (see --profile in lispy.py)
+    core.flush_output()
+    report(core.scope["*standard-error*"])
+
+# Sampling
+
+sample_interval = 0.005
+
+# The number of samples of each collapsed stack
+samples = {}
+
+# The code of the Python frames that call lambdas or expand macros, and
+# the local variable the lambda or macro is in
+callers = {}
+
+def find_callers():
+    import compiler
+    callers[invoke.func_code] = "self"
+    callers[expand.func_code] = "self"
+    # Both kinds of entry point compile_enter makes
+    for code in compiler.compile_enter.func_code.co_consts:
+        if hasattr(code, "co_name") and code.co_name == "enter":
+            callers[code] = "l"
+
+def label(f):
+    if f.name is None:
+        name = "(fn)"
+    else:
+        name = f.name
+    if f.__class__ == Macro:
+        name += " (macro)"
+    if f.position is not None:
+        if f.position[0] is None:
+            name += " line %d" % f.position[1]
+        else:
+            name += " %s:%d" % f.position
+    return name
+
+def lispy_stack(frame):
+    # The labels of the lambdas and macros being called, outermost first
+    stack = []
+    while frame is not None:
+        local = callers.get(frame.f_code)
+        if local is not None:
+            f = frame.f_locals[local]
+            # Lambda.invoke calls the code of compiled lambdas, whose
+            # frame is already in the stack
+            if not (local == "self" and f.code is not None):
+                stack.append(label(f))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def sample(signum, frame):
+    stack = ";".join(lispy_stack(frame)) or "(top level)"
+    samples[stack] = samples.get(stack, 0) + 1
+
+def start_sampling():
+    if not len(callers):
+        find_callers()
+    signal.signal(signal.SIGPROF, sample)
+    # Let reads and writes the timer interrupts carry on
+    signal.siginterrupt(signal.SIGPROF, False)
+    signal.setitimer(signal.ITIMER_PROF, sample_interval, sample_interval)
+
+def stop_sampling():
+    signal.setitimer(signal.ITIMER_PROF, 0)
+
+def write_samples(filename):
+    # Write the collapsed stacks, once sampling is done (see --sample in
+    # lispy.py)
+    stop_sampling()
+    f = open(filename, "w")
+    for stack, count in sorted(samples.items()):
+        f.write("%s %d\n" % (stack, count))
+    f.close()
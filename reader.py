@@ -1,202 +1,259 @@
 # Copyright 2010 Curtis McEnroe <programble@gmail.com>
 # Licensed under the GNU GPLv3
 
-import string
+import re
 
 from ast import *
 
-class Reader:
-    def __init__(self, source, filename=None):
-        self.filename = filename
-        self.lineno = 1
-        self.source = source + '\n'
-        self.index = -1
+# The source is split into tokens by a single regular expression, with a
+# group for each kind of token, after any whitespace. Numbers, keywords
+# and symbols run up to whitespace or a right parenthesis, brace or
+# bracket, and symbols can also quote any characters between bars.
+tokens = re.compile(r"""\s*(?:
+    (;[^\n]*)                                # 1: comment
+  | (\()                                     # 2: left parenthesis
+  | (\))                                     # 3: right parenthesis
+  | (\#?\{)                                  # 4: left brace, of a map or set
+  | (\})                                     # 5: right brace
+  | (\[)                                     # 6: left bracket, of a vector
+  | (\])                                     # 7: right bracket
+  | ((?:[^\s)}\]|("'`,:\\.\d{[-]|-(?!\d)|\|[^|]*\|)
+     [^\s)}\]|]*(?:\|[^|]*\|[^\s)}\]|]*)*)   # 8: symbol
+  | (-?\d[^\s)}\]]*)                         # 9: number
+  | "((?:[^"\\]|\\.)*)"                      # 10: string
+  | ('|`|,@|,)                               # 11: quote
+  | :([^\s)}\]]*)                            # 12: keyword
+  | \\(.)                                    # 13: character
+  | (\.)                                     # 14: dot
+  | (.)                                      # 15: anything else
+)""", re.S | re.X)
+(COMMENT, LEFT, RIGHT, LEFT_BRACE, RIGHT_BRACE, LEFT_BRACKET, RIGHT_BRACKET, SYMBOL,
+ NUMBER, STRING, QUOTE, KEYWORD, CHARACTER, DOT, ERROR) = range(1, 16)
 
-    def current(self):
-        try:
-            return self.source[self.index]
-        except IndexError:
-            raise EOFError("unexpected EOF")
+# Outside a list, a dot starts a symbol
+dotted = re.compile(r"\.[^\s)}\]|]*(?:\|[^|]*\|[^\s)}\]|]*)*")
 
-    def next(self):
-        self.index += 1
-        return self.current()
+bars = re.compile(r"\|([^|]*)\|")
+escape = re.compile(r"\\(.)", re.S)
+escapes = {'n': '\n', 'r': '\r', '"': '"'}
 
-    def prev(self):
-        self.index -= 1
-        return self.current()
+def unescape(match):
+    c = match.group(1)
+    # TODO: Add more escape codes
+    return escapes.get(c, '\\' + c)
 
-    def read(self):
-        exprs = []
-        while self.index + 1 < len(self.source):
-            self.next()
-            if self.current() in string.whitespace:
-                if self.current() == '\n':
-                    self.lineno += 1
-                # Ignore
-                continue
-            elif self.current() == ';':
-                # Comment until EOL
-                while self.next() != '\n':
-                    pass
-                self.lineno += 1
-                continue
-            elif self.current() == '(':
-                exprs.append(self.read_list())
-            elif self.current() == ')':
-                raise SyntaxError("unexpected right parenthesis")
-            elif self.current() == '"':
-                exprs.append(self.read_string())
-            elif self.current() in string.digits:
-                self.prev()
-                exprs.append(self.read_number())
-            elif self.current() == '-':
-                if self.next() in string.digits:
-                    self.prev()
-                    self.prev()
-                    exprs.append(self.read_number())
-                else:
-                    self.prev()
-                    self.prev()
-                    exprs.append(self.read_symbol())
-            elif self.current() in "'`,":
-                exprs.append(self.read_quote())
-            elif self.current() == ':':
-                exprs.append(self.read_keyword())
-            elif self.current() == '\\':
-                exprs.append(self.read_character())
-            else:
-                self.prev()
-                exprs.append(self.read_symbol())
-            exprs[-1].meta["file"] = self.filename
-            exprs[-1].meta["line"] = self.lineno
-        return exprs
+quotes = {"'": "quote", '`': "syntax-quote", ',': "unquote", ',@': "unquote-splice"}
 
-    def read_list(self):
-        list = []
-        proper = True
-        while self.next() != ')':
-            if self.current() in string.whitespace:
-                if self.current() == '\n':
-                    self.lineno += 1
-                # Ignore
-                continue
-            elif self.current() == ';':
-                # Comment until EOL
-                while self.next() != '\n':
-                    pass
-                self.lineno += 1
-                continue
-            elif self.current() == '(':
-                # List in a list in a list in a list
-                list.append(self.read_list())
-            elif self.current() == '.':
-                # Improper list
-                proper = False
-            elif self.current() == '"':
-                list.append(self.read_string())
-            elif self.current() in string.digits:
-                self.prev()
-                list.append(self.read_number())
-            elif self.current() == '-':
-                if self.next() in string.digits:
-                    self.prev()
-                    self.prev()
-                    list.append(self.read_number())
-                else:
-                    self.prev()
-                    self.prev()
-                    list.append(self.read_symbol())
-            elif self.current() in "'`,":
-                list.append(self.read_quote())
-            elif self.current() == ':':
-                list.append(self.read_keyword())
-            elif self.current() == '\\':
-                list.append(self.read_character())
-            else:
-                self.prev()
-                list.append(self.read_symbol())
-            list[-1].meta["file"] = self.filename
-            list[-1].meta["line"] = self.lineno
-        if proper and len(list):
-            return List(list + [[]])
-        else:
-            return List(list)
-        return l
+new = object.__new__
+symbols = Symbol.table
+keywords = Keyword.table
 
-    def read_string(self):
-        string = ""
-        while self.next() != '"':
-            # Escape codes
-            if self.current() == '\\':
-                escape = self.next()
-                if escape == 'n':
-                    string += '\n'
-                elif escape == 'r':
-                    string += '\r'
-                elif escape == '"':
-                    string += '"'
-                # TODO: Add more escape codes
-                else:
-                    string += '\\' + escape
-            else:
-                string += self.current()
-        return String(string)
+# Tokens read as interned atoms, which are shared and have no position
+interned_kinds = frozenset([SYMBOL, KEYWORD, DOT])
 
-    def read_number(self):
-        number = ""
-        while self.next() not in string.whitespace + ')':
-            number += self.current()
-        if '.' in number:
-            try:
-                number = float(number)
-            except ValueError:
-                raise
-        else:
-            try:
-                number = int(number)
-            except ValueError:
-                raise
-        self.prev()
-        return Number(number)
+class Reader:
+    # Reads forms from source text. The text can be given all at once, or
+    # fed in chunks, in which case each form is read as soon as the chunks
+    # fed complete it, and any part of a form is kept until the rest of it
+    # is fed.
+    def __init__(self, source="", filename=None):
+        self.filename = filename
+        self.lineno = 1
+        # Text not read yet
+        self.source = source
+        # Lists and quotes started but not finished, outermost first (see
+        # read_forms)
+        self.open = []
 
-    def read_quote(self):
-        if self.current() == "'":
-            expr = [Symbol("quote")]
-        elif self.current() == '`':
-            expr = [Symbol("syntax-quote")]
-        elif self.current() == ',':
-            if self.next() == '@':
-                expr = [Symbol("unquote-splice")]
-            else:
-                self.prev()
-                expr = [Symbol("unquote")]
-        self.next()
-        if self.current() == '(':
-            expr.append(self.read_list())
-        else:
-            self.prev()
-            expr.append(self.read_symbol())
-        return List(expr + [[]])
+    def read(self):
+        # Read every form in the source
+        return self.feed("", True)
 
-    def read_keyword(self):
-        keyword = ""
-        while self.next() not in string.whitespace + ')':
-            keyword += self.current()
-        self.prev()
-        return Keyword(keyword)
+    def feed(self, text, end=False):
+        # Read the forms text completes. With end, the source ends after
+        # text, and any part of a form left is an error.
+        self.source += text
+        if end:
+            self.source += '\n'
+        return self.read_forms(end)
 
-    def read_character(self):
-        return Character(self.next())
+    def forms(self, chunks):
+        # Yield each form as soon as the chunks complete it
+        for chunk in chunks:
+            for form in self.feed(chunk):
+                yield form
+        for form in self.feed("", True):
+            yield form
 
-    def read_symbol(self):
-        symbol = ""
-        while self.next() not in string.whitespace + ')':
-            if self.current() == '|':
-                while self.next() != '|':
-                    symbol += self.current()
-            else:
-                symbol += self.current()
-        self.prev()
-        return Symbol(symbol)
+    def partial(self):
+        # Whether part of a form has been fed
+        return len(self.open) > 0 or self.source.strip() != ""
 
+    def read_forms(self, end):
+        filename = self.filename
+        source = self.source
+        size = len(source)
+        # Forms are given the line they end on. Newlines are counted from
+        # the end of the last form read.
+        lineno = self.lineno
+        last = 0
+        exprs = []
+        # The items of each list being read, after whether it is proper,
+        # of each map, set or vector, after its class, and for each quote
+        # waiting for the form it quotes, its symbol
+        stack = [exprs] + self.open
+        items = stack.pop()
+        # Where reading stopped, if it stopped at a token the text still
+        # to come may finish
+        stopped = None
+        # Without the end of the source, a token running to the end of
+        # the text might go on in the next chunk
+        if end:
+            limit = -1
+        else:
+            limit = size
+        # Forms read from the same line share their position
+        position = (filename, lineno)
+        restart = 0
+        while restart is not None:
+            matches = tokens.finditer(source, restart)
+            restart = None
+            for match in matches:
+                kind = match.lastindex
+                after = match.end()
+                if after == limit:
+                    stopped = match.start()
+                    break
+                if kind == SYMBOL:
+                    s = match.group(SYMBOL)
+                    if not end and source[after] == '|':
+                        stopped = match.start()
+                        break
+                    if '|' in s:
+                        s = bars.sub(r"\1", s)
+                    form = symbols.get(s) or Symbol(s)
+                elif kind == LEFT:
+                    stack.append(items)
+                    items = [True]
+                    continue
+                elif kind == RIGHT:
+                    if not len(stack) or items.__class__ == str or items[0].__class__ != bool:
+                        raise SyntaxError("unexpected right parenthesis")
+                    # Build the list from its last cell
+                    if items[0] and len(items) > 1:
+                        form = List()
+                        i = len(items) - 1
+                    elif len(items) > 2:
+                        # Improper list
+                        form = items[-1]
+                        i = len(items) - 2
+                    else:
+                        form = List(items[1:])
+                        i = 0
+                    while i:
+                        cell = new(List)
+                        cell.head = items[i]
+                        cell.tail = form
+                        form = cell
+                        i -= 1
+                    items = stack.pop()
+                elif kind == LEFT_BRACE:
+                    stack.append(items)
+                    # Braces are read like a list, marked with what they make
+                    if match.group(LEFT_BRACE) == '{':
+                        items = [Map]
+                    else:
+                        items = [Set]
+                    continue
+                elif kind == RIGHT_BRACE:
+                    if not len(stack) or items.__class__ == str or not (items[0] is Map or items[0] is Set):
+                        raise SyntaxError("unexpected right brace")
+                    if items[0] == Set:
+                        form = Set(items[1:])
+                    elif len(items) % 2:
+                        form = Map(zip(items[1::2], items[2::2]))
+                    else:
+                        raise SyntaxError("expected a value for each key of a map")
+                    items = stack.pop()
+                elif kind == LEFT_BRACKET:
+                    stack.append(items)
+                    items = [Vector]
+                    continue
+                elif kind == RIGHT_BRACKET:
+                    if not len(stack) or items.__class__ == str or items[0] is not Vector:
+                        raise SyntaxError("unexpected right bracket")
+                    form = Vector(items[1:])
+                    items = stack.pop()
+                elif kind == NUMBER:
+                    s = match.group(NUMBER)
+                    form = new(Number)
+                    if '.' in s:
+                        form.data = float(s)
+                    else:
+                        form.data = int(s)
+                elif kind == COMMENT:
+                    continue
+                elif kind == STRING:
+                    s = match.group(STRING)
+                    # Escape codes
+                    if '\\' in s:
+                        s = escape.sub(unescape, s)
+                    form = String(s)
+                elif kind == QUOTE:
+                    stack.append(items)
+                    items = quotes[match.group(QUOTE)]
+                    continue
+                elif kind == KEYWORD:
+                    s = match.group(KEYWORD)
+                    form = keywords.get(s) or Keyword(s)
+                elif kind == CHARACTER:
+                    form = new(Character)
+                    form.data = match.group(CHARACTER)
+                elif kind == DOT:
+                    if len(stack) and items.__class__ == list and items[0].__class__ == bool:
+                        items[0] = False
+                        continue
+                    after = dotted.match(source, match.start(DOT)).end()
+                    if not end and (after == size or source[after] == '|'):
+                        stopped = match.start()
+                        break
+                    if source[after] == '|':
+                        raise EOFError("unexpected EOF")
+                    form = Symbol(bars.sub(r"\1", source[match.start(DOT):after]))
+                    # Carry on after the symbol
+                    restart = after
+                elif match.group(ERROR).isspace():
+                    # Whitespace at the end
+                    continue
+                elif not end:
+                    # An unterminated string or bars
+                    stopped = match.start()
+                    break
+                else:
+                    raise EOFError("unexpected EOF")
+                lines = source.count('\n', last, after)
+                if lines:
+                    lineno += lines
+                    position = (filename, lineno)
+                last = after
+                if kind not in interned_kinds:
+                    form.position = position
+                # Quote the form for each quote waiting for it
+                while items.__class__ == str:
+                    form = List([Symbol(items), form, []])
+                    form.position = position
+                    items = stack.pop()
+                items.append(form)
+                if restart is not None:
+                    break
+        # Keep what is left for the next chunk
+        if stopped is None:
+            stopped = size
+        self.lineno = lineno + source.count('\n', last, stopped)
+        self.source = source[stopped:]
+        stack.append(items)
+        self.open = stack[1:]
+        if end and len(self.open):
+            self.open = []
+            raise EOFError("unexpected EOF")
+        return exprs
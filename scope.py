@@ -1,6 +1,8 @@
 # Copyright 2010 Curtis McEnroe <programble@gmail.com>
 # Licensed under the GNU GPLv3
 
+import threading
+
 class Scope:
     def __init__(self, parent=None):
         self.bindings = {}
@@ -33,3 +35,53 @@ class Scope:
 
     def has_key(self, key):
         return self.bindings.has_key(key)
+
+    def clone(self, parent):
+        # A scope with the same bindings, and another parent
+        scope = Scope(parent)
+        scope.bindings = self.bindings
+        return scope
+
+def dynamic(name):
+    # Whether name is of a dynamic var, which binding can rebind for a
+    # single thread. Their names start and end with *.
+    return len(name) > 2 and name[0] == "*" and name[-1] == "*"
+
+class ThreadBindings(threading.local):
+    # The dynamic vars binding has rebound in a thread, or None
+    bindings = None
+
+class GlobalScope(Scope):
+    # The global scope, where dynamic vars can also be bound for each
+    # thread (see binding in core.py). Lambdas clone it to give it a
+    # parent, the scope they are called in.
+    def __init__(self, bindings=None, parent=None, threads=None):
+        if bindings is None:
+            bindings = {}
+        self.bindings = bindings
+        self.parent = parent
+        self.threads = threads or ThreadBindings()
+
+    def __getitem__(self, key):
+        if key[:1] == "*":
+            bindings = self.threads.bindings
+            if bindings is not None and key in bindings:
+                return bindings[key]
+        if self.bindings.has_key(key):
+            return self.bindings[key]
+        elif self.parent:
+            return self.parent[key]
+        raise NameError("name '%s' is not bound" % key)
+
+    def clone(self, parent):
+        return GlobalScope(self.bindings, parent, self.threads)
+
+    def rebind(self, key, value):
+        # Set a dynamic var bound in this thread. Returns its previous
+        # value, or None if it is not bound in this thread.
+        bindings = self.threads.bindings
+        if bindings is None or key not in bindings:
+            return None
+        ret = bindings[key]
+        bindings[key] = value
+        return ret
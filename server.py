@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# Copyright 2010 Curtis McEnroe <programble@gmail.com>
+# Licensed under the GNU GPLv3
+
+# Evaluation server. `lispy --server=SOCKET` loads the core once and
+# listens on a Unix domain socket. For each request it forks a process,
+# which evaluates an expression or a file with the core already loaded
+# and exits, so what one request defines is not seen by the others, or
+# by the server. At most `connections` requests are evaluated at once,
+# and the rest wait to be accepted.
+#
+# A request is a line for each of its fields, a name and a value with
+# its special characters escaped as in Python strings, and an empty line:
+# "evaluate" with an expression or "file" with a filename, and "cwd", the
+# directory relative filenames are opened from. The request's process
+# reads its input from the rest of the connection, and writes its output
+# and errors to it.
+#
+# Run as a script, this is the client, which imports nothing of the
+# interpreter so that it starts quickly (and quicker still with -S):
+#
+#     python server.py SOCKET -e expr
+#     python server.py SOCKET file
+#
+# It sends what it reads from its input to the request, and writes what
+# the request outputs.
+
+import os
+import sys
+import errno
+import select
+import signal
+import socket
+import threading
+import traceback
+
+# How many requests are evaluated at once (see --connections)
+connections = 8
+
+# How often a server waiting for requests reaps those that have finished,
+# in seconds
+reap_interval = 1.0
+
+def listen(path):
+    # Remove what a server that was stopped left of the socket
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.remove(path)
+        else:
+            raise socket.error(errno.EADDRINUSE, "%s is in use by another server" % path)
+        finally:
+            probe.close()
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(path)
+    s.listen(128)
+    return s
+
+def serve(path, handle):
+    # Call handle with each request, in a forked process
+    s = listen(path)
+    children = set()
+    # Remove the socket when stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    try:
+        while True:
+            reap(children)
+            # Wake up now and then to reap requests while none come in
+            try:
+                if not select.select([s], [], [], reap_interval)[0]:
+                    continue
+            except select.error, e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            try:
+                conn = s.accept()[0]
+            except socket.error, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            pid = os.fork()
+            if pid == 0:
+                s.close()
+                try:
+                    run(conn, handle)
+                except SystemExit:
+                    pass
+                except:
+                    traceback.print_exc()
+                finally:
+                    # Not returning to the loop of the server
+                    os._exit(0)
+            conn.close()
+            children.add(pid)
+    finally:
+        s.close()
+        os.remove(path)
+
+def reap(children):
+    # Wait for the requests that have finished, and for one to finish if
+    # too many are running
+    while children:
+        pid, status = os.waitpid(-1, 0 if len(children) >= connections else os.WNOHANG)
+        if pid == 0:
+            break
+        children.discard(pid)
+
+def run(conn, handle):
+    # In the process forked for a request
+    request = read_request(conn.makefile("rb", 0))
+    os.chdir(request.get("cwd", "/"))
+    for fd in (0, 1, 2):
+        os.dup2(conn.fileno(), fd)
+    conn.close()
+    try:
+        handle(request)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+def read_request(f):
+    request = {}
+    for line in iter(f.readline, "\n"):
+        if not line:
+            raise EOFError("the request ended before its empty line")
+        name, value = line.rstrip("\n").split(" ", 1)
+        request[name] = value.decode("string_escape")
+    return request
+
+def write_request(request):
+    return "".join("%s %s\n" % (name, value.encode("string_escape"))
+                   for name, value in request.items()) + "\n"
+
+def connect(path, request):
+    # Send a request to a server and copy its output to ours
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    request["cwd"] = os.getcwd()
+    s.sendall(write_request(request))
+    # The input is sent as it is read, as the request may wait for it
+    sender = threading.Thread(target=send_input, args=(s,))
+    sender.daemon = True
+    sender.start()
+    while True:
+        data = s.recv(65536)
+        if not data:
+            break
+        os.write(1, data)
+    s.close()
+
+def send_input(s):
+    try:
+        while True:
+            data = os.read(0, 65536)
+            if not data:
+                break
+            s.sendall(data)
+        s.shutdown(socket.SHUT_WR)
+    except (OSError, socket.error):
+        # The request has finished
+        pass
+
+def help():
+    print "Usage: %s socket file" % sys.argv[0]
+    print "       %s socket -e expr" % sys.argv[0]
+    print "Evaluate a file or an expression on the server listening on socket"
+    print "(see lispy --server)"
+    print
+
+def main(argv):
+    if len(argv) == 3 and argv[1] in ("-e", "--evaluate"):
+        request = {"evaluate": argv[2]}
+    elif len(argv) == 2 and not argv[1].startswith("-"):
+        request = {"file": os.path.abspath(argv[1])}
+    else:
+        help()
+        sys.exit(1)
+    try:
+        connect(argv[0], request)
+    except socket.error, e:
+        print "Cannot connect to %s: %s" % (repr(argv[0]), e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -10,20 +10,25 @@
                (test (= '(1 2) '(1 2)))
                (test (= '(1 . 2) '(1 . 2)))
                (test (= '() ()))
-               (test (= '() nil)))
+               (test (= '() nil))
+               (test (not (= 'foo :foo))))
 
 (test-function car
                (test (= (car '(:foo :bar :baz)) :foo))
                (test (= (car '(:foo . :bar)) :foo))
                (test (= (car '(:foo)) :foo))
-               (test (= (car '()) nil)))
+               (test (= (car '()) nil))
+               (test (= (car [:foo :bar]) :foo))
+               (test (= (car []) nil)))
 
 (test-function cdr
                (test (= (cdr '(:foo . :bar)) :bar))
                (test (= (cdr '(:foo :bar)) '(:bar)))
                (test (= (cdr '(:foo :bar :baz)) '(:bar :baz)))
                (test (= (cdr '(:foo)) nil))
-               (test (= (cdr '()) nil)))
+               (test (= (cdr '()) nil))
+               (test (= (cdr [:foo :bar :baz]) [:bar :baz]))
+               (test (= (cdr [:foo]) nil)))
 
 (test-function cons
                (test (= (cons :foo :bar) '(:foo . :bar)))
@@ -46,6 +51,15 @@
                (set! *test* :foo)
                (test (= (list *test* :bar) '(:foo :bar))))
 
+(test-function fn
+               (test (= ((fn (x) x) :foo) :foo))
+               (test (= ((fn (x ? y) (list x y)) :foo) (list :foo nil)))
+               (test (= ((fn (x ? (y :bar)) (list x y)) :foo) '(:foo :bar)))
+               (test (= ((fn (x ? (y :bar)) (list x y)) :foo :baz) '(:foo :baz)))
+               (test (= ((fn (? x y) (list x y)) :foo) (list :foo nil)))
+               (test (= ((fn (x & y) y) :foo :bar :baz) '(:bar :baz)))
+               (test (= ((fn (x & y) y) :foo) nil)))
+
 (test-function let
                (let ((foo :foo))
                  (test (= foo :foo)))
@@ -56,6 +70,13 @@
                (let ((*test* :bar))
                  (test (= *test* :bar))))
 
+(test-function binding
+               (test (= (binding ((*test* :foo)) *test*) :foo))
+               (set! *test* :bar)
+               (set! *test-fn* (fn () *test*))
+               (test (= (binding ((*test* :baz)) (*test-fn*)) :baz))
+               (test (= (*test-fn*) :bar)))
+
 (test-function do
                (test (= (do :foo :bar :baz) :baz)))
 
@@ -102,6 +123,205 @@
                (def *test-test* (macro (x) `(*test* ,x)))
                (test (= (macroexpand (*test-test* 1)) '(+ 1 1))))
 
+(test-function macroexpand-all
+               (set! *test* (macro (x) `(+ ,x 1)))
+               (test (= (macroexpand-all (*test* (*test* 1))) '(+ (+ 1 1) 1)))
+               (test (= (macroexpand-all (list '(*test* 1))) '(list (quote (*test* 1)))))
+               (test (= (macroexpand-all (fn (*test*) (*test* 1))) '(fn (*test*) (*test* 1))))
+               (test (= (macroexpand-all [(*test* 1) {:foo (*test* 2)}]) '[(+ 1 1) {:foo (+ 2 1)}]))
+               (test (= (macroexpand-all (fn (? (x (*test* 1))) x)) '(fn (? (x (+ 1 1))) x)))
+               (test (= (macroexpand-all `(foo ,(*test* 1) (*test* 2))) '(syntax-quote (foo (unquote (+ 1 1)) (*test* 2))))))
+
+(test-function macro
+               (set! *test* (macro (x) `(+ ,x 1)))
+               (set! *test-fn* (fn () (*test* 1)))
+               (test (= (*test-fn*) 2))
+               (set! *test* (macro (x) `(- ,x 1)))
+               ;; Lambdas made with --expand-macros keep the expansions
+               ;; they were made with
+               (test (= (*test-fn*) (if (expand-macros?) 2 0))))
+
+(test-function profile
+               (test (= (profile (+ 1 2)) 3))
+               (test (= (profile (reduce + (map (fn (x) (* x 2)) '(1 2 3)))) 12)))
+
+(test-function profile-report
+               (test (= (with-open ((f (open "/dev/null" "w")))
+                          (binding ((*out* f)) (profile-report :calls)))
+                        nil)))
+
+(test-function lispy-stats
+               (test (list? (lispy-stats)))
+               (test (keyword? (car (car (lispy-stats)))))
+               (test (number? (cdr (car (lispy-stats))))))
+
+(test-function apply
+               (test (= (apply + '(1 2 3)) 6))
+               (test (= (apply list '(1 2)) '(1 2))))
+
+(test-function map
+               (test (= (map (fn (x) (+ x 1)) '(1 2 3)) '(2 3 4)))
+               (test (= (map (fn (x) (+ x 1)) [1 2 3]) '(2 3 4)))
+               (test (= (map car nil) nil))
+               (test (= (def map car) nil))
+               (test (= (map car '((1) (2))) '(1 2))))
+
+(test-function filter
+               (test (= (filter even? '(1 2 3 4)) '(2 4)))
+               (test (= (filter even? [1 2 3 4]) '(2 4)))
+               (test (= (filter even? '(1 3)) nil)))
+
+(test-function reduce
+               (test (= (reduce + '(1 2 3)) 6))
+               (test (= (reduce + [1 2 3]) 6))
+               (test (= (reduce (fn (acc x) (cons x acc)) '(1 2) nil) '(2 1))))
+
+(test-function count
+               (test (= (count '(:foo :bar)) 2))
+               (test (= (count [:foo :bar]) 2))
+               (test (= (count "foo") 3))
+               (test (= (count nil) 0)))
+
+(test-function nth
+               (test (= (nth '(:foo :bar) 1) :bar))
+               (test (= (nth '(:foo) 2) nil))
+               (test (= (nth [:foo :bar] 1) :bar))
+               (test (= (nth [:foo] 2) nil))
+               (test (= (nth "foo" 1) \o))
+               (test (= (nth (range 3) 1) 1))
+               (test (= (nth (range 3) -1) nil))
+               (test (= (nth '(:foo) -1) nil)))
+
+(test-function last
+               (test (= (last '(:foo :bar)) :bar))
+               (test (= (last [:foo :bar]) :bar)))
+
+(test-function append
+               (test (= (append '(:foo) :bar) '(:foo :bar)))
+               (test (= (append nil :foo) '(:foo))))
+
+(test-function concat
+               (test (= (concat '(:foo) '(:bar :baz)) '(:foo :bar :baz))))
+
+(test-function reverse
+               (test (= (reverse '(:foo :bar)) '(:bar :foo))))
+
+(test-function range
+               (test (= (range 3) '(0 1 2)))
+               (test (= (range 1 3) '(1 2)))
+               (test (= (range 0) nil))
+               (test (nil? (range 0)))
+               (test (= (car (cdr (range 3))) 1))
+               (test (= (cons :foo (range 1)) '(:foo 0)))
+               (test (= (reduce + (map inc (filter even? (range 100000)))) 2500000000))
+               (set! *test* 0)
+               (test (= (let ((xs (map (fn (x) (do (set! *test* (+ *test* 1)) x)) (range 3))))
+                          (list (count xs) (reduce + xs) (count xs) *test*))
+                        '(3 3 3 3))))
+
+(test-function take
+               (test (= (take 2 '(1 2 3)) '(1 2)))
+               (test (= (take 2 '(1)) '(1)))
+               (test (= (take 3 (range 10)) '(0 1 2))))
+
+(test-function take-while
+               (test (= (take-while neg? '(-1 -2 0 -3)) '(-1 -2)))
+               (test (= (take-while neg? (range 10)) nil)))
+
+(test-function drop
+               (test (= (drop 2 '(1 2 3)) '(3)))
+               (test (= (drop 3 (range 4)) '(3))))
+
+(test-function iterate
+               (test (= (take 4 (iterate (fn (x) (* x 2)) 1)) '(1 2 4 8)))
+               (test (= (car (cdr (iterate inc 0))) 1)))
+
+(test-function pmap
+               (test (= (pmap (fn (x) (* x x)) '(1 2 3)) '(1 4 9)))
+               (set! *test* 10)
+               (test (= (pmap (fn (x) (+ x *test*)) [1 2]) '(11 12)))
+               (test (= (pmap car nil) nil)))
+
+(test-function pfor
+               (test (= (pfor (x (range 3)) (list x)) '((0) (1) (2)))))
+
+(test-function preduce
+               (test (= (preduce + (range 100)) 4950))
+               (test (= (preduce + '(1 2 3) 10) 16)))
+
+(test-function contains?
+               (test (contains? '(:foo :bar) :bar))
+               (test (not (contains? '(:foo) :bar))))
+
+(test-function hash-map
+               (test (= (hash-map :foo 1 :bar 2) {:bar 2 :foo 1}))
+               (test (= {:foo (+ 1 2)} {:foo 3}))
+               (test (= (hash-map) {})))
+
+(test-function hash-set
+               (test (= (hash-set :foo :bar :foo) #{:bar :foo}))
+               (test (= #{(+ 1 2)} #{3})))
+
+(test-function get
+               (test (= (get {:foo 1 :bar 2} :bar) 2))
+               (test (= (get {'(1 2) :foo} (list 1 2)) :foo))
+               (test (= (get {} :foo) nil))
+               (test (= (get {} :foo :bar) :bar))
+               (test (= (get #{:foo} :foo) :foo))
+               (test (= (get [:foo :bar] 1) :bar))
+               (test (= (get '((:foo . 1) (:bar . 2)) :bar) 2))
+               (test (= (get nil :foo :bar) :bar)))
+
+(test-function assoc
+               (test (= (assoc {:foo 1} :bar 2) {:foo 1 :bar 2}))
+               (test (= (assoc {:foo 1} :foo 2) {:foo 2}))
+               (test (= (assoc '((:foo . 1)) :foo 2) '((:foo . 2)))))
+
+(test-function dissoc
+               (test (= (dissoc {:foo 1 :bar 2} :foo) {:bar 2}))
+               (test (= (dissoc {:foo 1} :bar) {:foo 1}))
+               (test (= (dissoc #{:foo :bar} :foo) #{:bar}))
+               (test (= (dissoc '((:foo . 1) (:bar . 2)) :foo) '((:bar . 2)))))
+
+(test-function keys
+               (test (= (keys {:foo 1}) '(:foo)))
+               (test (= (keys '((:foo . 1) (:bar . 2))) '(:foo :bar))))
+
+(test-function vals
+               (test (= (vals {:foo 1}) '(1)))
+               (test (= (vals '((:foo . 1) (:bar . 2))) '(1 2))))
+
+(test-function conj
+               (test (= (conj #{:foo} :bar :foo) #{:foo :bar}))
+               (test (= (conj {} '(:foo . 1)) {:foo 1}))
+               (test (= (conj '(:foo) :bar) '(:bar :foo)))
+               (set! *test* [:foo])
+               (test (= (conj *test* :bar :baz) [:foo :bar :baz]))
+               (test (= (conj *test* :baz) [:foo :baz]))
+               (test (= (conj (subvec [:foo :bar] 0 1) :baz) [:foo :baz])))
+
+(test-function vector
+               (test (= (vector :foo (+ 1 2)) [:foo 3]))
+               (test (= [(+ 1 2)] [3]))
+               (test (not (= [:foo] '(:foo))))
+               (test (nil? (dolist (x [:foo :bar]) x)))
+               (test (= (zip [:foo :bar] '(1 2)) '((:foo . 1) (:bar . 2)))))
+
+(test-function vec
+               (test (= (vec '(:foo :bar)) [:foo :bar]))
+               (test (= (vec nil) [])))
+
+(test-function subvec
+               (test (= (subvec [:foo :bar :baz] 1) [:bar :baz]))
+               (test (= (subvec [:foo :bar :baz] 1 2) [:bar])))
+
+(test-function disj
+               (test (= (disj #{:foo :bar} :foo) #{:bar})))
+
+(test-function str-to-list
+               (test (= (str-to-list "foo") '(\f \o \o)))
+               (test (= (str-to-list "") nil)))
+
 (test-function format
                (test (= (format "%s" "foo") "foo"))
                (test (= (format "%s" :foo) "foo"))
@@ -125,6 +345,40 @@
 (test-function ord
                (test (= (ord \a) 97)))
 
+(test-function read-line
+               (test (= (with-open ((f (open "tests.lisp"))) (read-line f))
+                        ";; Copyright 2010 Curtis McEnroe <programble@gmail.com>"))
+               (test (= (with-open ((f (open "tests.lisp"))) (count (line-seq f)) (read-line f)) nil)))
+
+(test-function line-seq
+               (test (= (with-open ((f (open "tests.lisp"))) (read-line f) (car (line-seq f)))
+                        ";; Licensed under the GNU GPLv3"))
+               (test (with-open ((f (open "tests.lisp")))
+                       (let ((ls (line-seq f)))
+                         (= (count ls) (count ls)))))
+               (test (= (with-open ((f (open "tests.lisp")))
+                          (let ((ls (line-seq f)))
+                            (count ls)
+                            (car ls)))
+                        ";; Copyright 2010 Curtis McEnroe <programble@gmail.com>")))
+
+(test-function read-file
+               (test (= (nth (read-file "tests.lisp") 1) \;)))
+
+(test-function with-open
+               (set! *test* nil)
+               (test (= (with-open ((f (open "tests.lisp"))) (set! *test* f) :foo) :foo))
+               (test (stream? *test*)))
+
+(test-function future
+               (test (= (deref (future (+ 1 2))) 3))
+               (test (= (binding ((*test* :foo)) (deref (future *test*))) :foo)))
+
+(test-function future-done?
+               (set! *test* (future :foo))
+               (deref *test*)
+               (test (future-done? *test*)))
+
 (test-function list?
                (test (list? '(1 2 3)))
                (test (list? nil))
@@ -158,3 +412,23 @@
 (test-function macro?
                (test (macro? test))
                (test (not (macro? (fn () nil)))))
+
+(test-function map?
+               (test (map? {:foo 1}))
+               (test (not (map? '((:foo . 1))))))
+
+(test-function set?
+               (test (set? #{:foo}))
+               (test (not (set? {}))))
+
+(test-function vector?
+               (test (vector? [:foo]))
+               (test (not (vector? '(:foo)))))
+
+(test-function stream?
+               (test (stream? *in*))
+               (test (not (stream? "foo"))))
+
+(test-function future?
+               (test (future? (future nil)))
+               (test (not (future? 1))))